@@ -1,16 +1,47 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import streamlit as st
 import requests
-import time
+from requests.adapters import HTTPAdapter
 import random
+import functools
+import threading
+import heapq
+import itertools
+import bisect
+import difflib
+import hashlib
+import inspect
+import math
+import re
+import sqlite3
 import json
 import os
-from datetime import datetime, timedelta
-import pandas as pd
-import plotly.graph_objects as go
-
-# File paths
-WATCHLIST_FILE = os.path.join(os.path.dirname(__file__), "watchlist.json")
-SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "settings.json")
+import sys
+import logging
+import tempfile
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# plotly is imported where the alert chart is drawn, so the first screens never load it
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+# File paths; VIBE_CHECK_DATA_DIR moves the data files away from the code, e.g. for benchmarks
+DATA_DIR = os.environ.get("VIBE_CHECK_DATA_DIR") or os.path.dirname(__file__)
+WATCHLIST_FILE = os.path.join(DATA_DIR, "watchlist.json")
+SETTINGS_FILE = os.path.join(DATA_DIR, "settings.json")
 
 # Translations
 TRANSLATIONS = {
@@ -32,9 +63,20 @@ TRANSLATIONS = {
         "no_watchlist": "No coins in watchlist. Search for a coin and add it!",
         "search_limit": "Search limit reached",
         "search_limit_msg": "The search bar has been temporarily imprisoned for excessive curiosity. Please wait while it serves its time...",
+        "busy_retry": "Too many lookups at once. Try again in a moment.",
         "alert_title": "Price Alert!",
         "alert_threshold_hit": "has hit your alert threshold!",
         "current_change": "Current 24h Change",
+        "alert_rule": "Alert rule",
+        "alert_level": "Price level (USD)",
+        "stale_data": "Last updated {minutes} min ago, refreshing…",
+        "rule_24h": "24h change",
+        "rule_5m": "5m change",
+        "rule_1h": "1h change",
+        "rule_4h": "4h change",
+        "rule_zscore": "Volatility z-score",
+        "rule_above": "Price rises above",
+        "rule_below": "Price falls below",
         "your_threshold": "Your Threshold",
         "price_history": "Price History (7 Days)",
         "dismiss": "Dismiss",
@@ -70,6 +112,7 @@ TRANSLATIONS = {
         "no_watchlist": "No hay monedas en la lista. Busca una moneda y agrégala!",
         "search_limit": "Límite de búsqueda alcanzado",
         "search_limit_msg": "La barra de búsqueda ha sido encarcelada temporalmente por curiosidad excesiva. Espera mientras cumple su condena...",
+        "busy_retry": "Demasiadas consultas a la vez. Inténtalo de nuevo en un momento.",
         "trending": "Tendencias",
         "market_overview": "Resumen del Mercado",
         "total_market_cap": "Cap. de Mercado Total",
@@ -80,6 +123,16 @@ TRANSLATIONS = {
         "alert_title": "¡Alerta de Precio!",
         "alert_threshold_hit": "ha alcanzado tu umbral de alerta!",
         "current_change": "Cambio Actual 24h",
+        "alert_rule": "Regla de alerta",
+        "alert_level": "Nivel de precio (USD)",
+        "stale_data": "Actualizado hace {minutes} min, actualizando…",
+        "rule_24h": "Cambio 24h",
+        "rule_5m": "Cambio 5m",
+        "rule_1h": "Cambio 1h",
+        "rule_4h": "Cambio 4h",
+        "rule_zscore": "Puntuación z de volatilidad",
+        "rule_above": "Precio sube de",
+        "rule_below": "Precio baja de",
         "your_threshold": "Tu Umbral",
         "price_history": "Historial de Precio (7 Días)",
         "dismiss": "Cerrar",
@@ -108,9 +161,20 @@ TRANSLATIONS = {
         "no_watchlist": "Aucune crypto dans la liste. Cherchez une crypto et ajoutez-la!",
         "search_limit": "Limite de recherche atteinte",
         "search_limit_msg": "La barre de recherche a été temporairement emprisonnée pour curiosité excessive. Veuillez patienter...",
+        "busy_retry": "Trop de recherches en même temps. Réessayez dans un instant.",
         "alert_title": "Alerte de Prix!",
         "alert_threshold_hit": "a atteint votre seuil d'alerte!",
         "current_change": "Variation Actuelle 24h",
+        "alert_rule": "Règle d'alerte",
+        "alert_level": "Niveau de prix (USD)",
+        "stale_data": "Mis à jour il y a {minutes} min, actualisation…",
+        "rule_24h": "Variation 24h",
+        "rule_5m": "Variation 5m",
+        "rule_1h": "Variation 1h",
+        "rule_4h": "Variation 4h",
+        "rule_zscore": "Score z de volatilité",
+        "rule_above": "Prix passe au-dessus de",
+        "rule_below": "Prix passe sous",
         "your_threshold": "Votre Seuil",
         "price_history": "Historique des Prix (7 Jours)",
         "dismiss": "Fermer",
@@ -146,9 +210,20 @@ TRANSLATIONS = {
         "no_watchlist": "Keine Coins in der Liste. Suche nach einem Coin und füge ihn hinzu!",
         "search_limit": "Suchlimit erreicht",
         "search_limit_msg": "Die Suchleiste wurde vorübergehend wegen übermäßiger Neugier eingesperrt. Bitte warten...",
+        "busy_retry": "Zu viele Anfragen gleichzeitig. Bitte gleich noch einmal versuchen.",
         "alert_title": "Preisalarm!",
         "alert_threshold_hit": "hat deinen Alarmschwellenwert erreicht!",
         "current_change": "Aktuelle 24h Änderung",
+        "alert_rule": "Alarmregel",
+        "alert_level": "Preisniveau (USD)",
+        "stale_data": "Vor {minutes} Min. aktualisiert, wird erneuert…",
+        "rule_24h": "24h-Änderung",
+        "rule_5m": "5m-Änderung",
+        "rule_1h": "1h-Änderung",
+        "rule_4h": "4h-Änderung",
+        "rule_zscore": "Volatilitäts-z-Wert",
+        "rule_above": "Preis steigt über",
+        "rule_below": "Preis fällt unter",
         "your_threshold": "Dein Schwellenwert",
         "price_history": "Preisverlauf (7 Tage)",
         "dismiss": "Schließen",
@@ -184,9 +259,20 @@ TRANSLATIONS = {
         "no_watchlist": "リストにコインがありません。コインを検索して追加してください！",
         "search_limit": "検索制限に達しました",
         "search_limit_msg": "検索バーは過度の好奇心のため一時的に投獄されました。しばらくお待ちください...",
+        "busy_retry": "同時に検索が多すぎます。少し待ってからもう一度お試しください。",
         "alert_title": "価格アラート！",
         "alert_threshold_hit": "がアラートしきい値に達しました！",
         "current_change": "現在の24時間変動",
+        "alert_rule": "アラートルール",
+        "alert_level": "価格レベル (USD)",
+        "stale_data": "{minutes}分前のデータ、更新中…",
+        "rule_24h": "24時間変動",
+        "rule_5m": "5分変動",
+        "rule_1h": "1時間変動",
+        "rule_4h": "4時間変動",
+        "rule_zscore": "ボラティリティzスコア",
+        "rule_above": "価格が上回る",
+        "rule_below": "価格が下回る",
         "your_threshold": "しきい値",
         "price_history": "価格履歴（7日間）",
         "dismiss": "閉じる",
@@ -222,9 +308,20 @@ TRANSLATIONS = {
         "no_watchlist": "列表中没有币种。搜索并添加一个币种！",
         "search_limit": "达到搜索限制",
         "search_limit_msg": "搜索栏因过度好奇而被暂时监禁。请稍候...",
+        "busy_retry": "同时查询过多，请稍后再试。",
         "alert_title": "价格提醒！",
         "alert_threshold_hit": "已达到您的提醒阈值！",
         "current_change": "当前24小时变化",
+        "alert_rule": "提醒规则",
+        "alert_level": "价格水平 (USD)",
+        "stale_data": "{minutes}分钟前的数据，正在刷新…",
+        "rule_24h": "24小时涨跌",
+        "rule_5m": "5分钟涨跌",
+        "rule_1h": "1小时涨跌",
+        "rule_4h": "4小时涨跌",
+        "rule_zscore": "波动率z分数",
+        "rule_above": "价格升破",
+        "rule_below": "价格跌破",
         "your_threshold": "您的阈值",
         "price_history": "价格历史（7天）",
         "dismiss": "关闭",
@@ -265,146 +362,1011 @@ TOP_50_COINS = [
     "theta-token", "optimism", "immutable-x", "bonk", "fantom", "algorand"
 ]
 
-def load_watchlist():
+# Storage
+logger = logging.getLogger("vibe_check")
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Advisory lock on a sidecar .lock file; a no-op where fcntl is unavailable"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def atomic_write_text(path, text):
+    """Write text to a temp file in the same directory and rename it over path"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
     try:
-        if os.path.exists(WATCHLIST_FILE):
-            with open(WATCHLIST_FILE, "r") as f:
-                return json.load(f)
-    except:
-        pass
-    return {}
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write_json(path, data, **dump_kwargs):
+    atomic_write_text(path, json.dumps(data, **dump_kwargs))
+
+# User store
+USER_DB_FILE = os.path.join(DATA_DIR, "vibe_check.sqlite3")
+USER_PARAM = "u"
+
+# Owner of the watchlist and settings imported from the old shared JSON files
+LEGACY_USER = "shared"
+
+class UserStore:
+    """Per-user watchlists and settings in SQLite, read and written one row at a time.
+
+    Watchlist rows are keyed by (user_id, coin_id) with a second index on
+    (coin_id, user_id), so "who watches coin X" is an index lookup for
+    alert fan-out.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS watchlist ("
+            "user_id TEXT, coin_id TEXT, name TEXT, symbol TEXT, threshold INTEGER, added_at REAL, "
+            "rule TEXT DEFAULT '24h', level REAL, PRIMARY KEY (user_id, coin_id)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS watchlist_coin ON watchlist (coin_id, user_id)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            "user_id TEXT, key TEXT, value TEXT, PRIMARY KEY (user_id, key)) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS alert_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, coin_id TEXT, name TEXT, symbol TEXT, "
+            "change REAL, threshold INTEGER, price REAL, created REAL, status TEXT DEFAULT 'pending', "
+            "rule TEXT DEFAULT '24h', value REAL, level REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS alert_events_user ON alert_events (user_id, status)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS alert_state ("
+            "user_id TEXT, coin_id TEXT, PRIMARY KEY (user_id, coin_id)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY)")
+        self.add_missing_columns()
+        self.import_legacy_files()
+
+    def add_missing_columns(self):
+        """Bring databases created before alert rules up to the current schema"""
+        for table, column, ddl in (
+            ("watchlist", "rule", "TEXT DEFAULT '24h'"),
+            ("watchlist", "level", "REAL"),
+            ("alert_events", "rule", "TEXT DEFAULT '24h'"),
+            ("alert_events", "value", "REAL"),
+            ("alert_events", "level", "REAL"),
+        ):
+            columns = {row[1] for row in self.db.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+    def import_legacy_files(self):
+        """Move the old single-file watchlist and settings into LEGACY_USER, once"""
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM migrations WHERE name = 'legacy_json'").fetchone():
+                return
+            watchlist, settings = {}, {}
+            for path, target in ((WATCHLIST_FILE, watchlist), (SETTINGS_FILE, settings)):
+                try:
+                    with file_lock(path, shared=True):
+                        with open(path, "r") as f:
+                            target.update(json.load(f))
+                except FileNotFoundError:
+                    pass
+                except (OSError, ValueError) as e:
+                    logger.warning("Could not import %s: %s", path, e)
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO watchlist (user_id, coin_id, name, symbol, threshold, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(LEGACY_USER, coin_id, info["name"], info["symbol"], info["threshold"], time.time())
+                 for coin_id, info in watchlist.items()]
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO settings VALUES (?, ?, ?)",
+                [(LEGACY_USER, key, json.dumps(value)) for key, value in settings.items()]
+            )
+            self.db.execute("INSERT INTO migrations VALUES ('legacy_json')")
+            self.db.execute("COMMIT")
+
+    def watchlist(self, user_id):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT coin_id, name, symbol, threshold, rule, level FROM watchlist "
+                "WHERE user_id = ? ORDER BY added_at",
+                (user_id,)
+            ).fetchall()
+        return {coin_id: {"name": name, "symbol": symbol, "threshold": threshold, "rule": rule, "level": level}
+                for coin_id, name, symbol, threshold, rule, level in rows}
+
+    def add_coin(self, user_id, coin_id, name, symbol, threshold):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO watchlist (user_id, coin_id, name, symbol, threshold, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, coin_id, name, symbol, threshold, time.time())
+            )
 
-def save_watchlist(watchlist):
-    try:
-        with open(WATCHLIST_FILE, "w") as f:
-            json.dump(watchlist, f)
-    except:
-        pass
+    def remove_coin(self, user_id, coin_id):
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute("DELETE FROM watchlist WHERE user_id = ? AND coin_id = ?", (user_id, coin_id))
+            self.db.execute("DELETE FROM alert_state WHERE user_id = ? AND coin_id = ?", (user_id, coin_id))
+            self.db.execute(
+                "UPDATE alert_events SET status = 'dismissed' WHERE user_id = ? AND coin_id = ? AND status = 'pending'",
+                (user_id, coin_id)
+            )
+            self.db.execute("COMMIT")
 
-def load_settings():
-    try:
-        if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, "r") as f:
-                return json.load(f)
-    except:
-        pass
-    return {}
+    def set_threshold(self, user_id, coin_id, threshold):
+        with self.lock:
+            self.db.execute(
+                "UPDATE watchlist SET threshold = ? WHERE user_id = ? AND coin_id = ?",
+                (threshold, user_id, coin_id)
+            )
 
-def save_settings(settings):
-    try:
-        with open(SETTINGS_FILE, "w") as f:
-            json.dump(settings, f)
-    except:
-        pass
+    def set_rule(self, user_id, coin_id, rule, threshold, level):
+        """Switch a coin to another alert rule; the next evaluation re-arms it from scratch"""
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                "UPDATE watchlist SET rule = ?, threshold = ?, level = ? WHERE user_id = ? AND coin_id = ?",
+                (rule, threshold, level, user_id, coin_id)
+            )
+            self.db.execute("DELETE FROM alert_state WHERE user_id = ? AND coin_id = ?", (user_id, coin_id))
+            self.db.execute("COMMIT")
+
+    def watchers(self, coin_id):
+        """(user_id, threshold) for everyone watching coin_id"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT user_id, threshold FROM watchlist WHERE coin_id = ?", (coin_id,)
+            ).fetchall()
+
+    def watch_rows(self):
+        """Every (user_id, coin_id, name, symbol, threshold, rule, level) row, for the alert worker"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT user_id, coin_id, name, symbol, threshold, rule, level FROM watchlist"
+            ).fetchall()
+
+    def record_alerts(self, breaches, cleared):
+        """Log an event for each newly breached (user, coin) and re-arm the ones back in range.
+
+        breaches holds (user_id, coin_id, name, symbol, threshold, rule, level,
+        change, value, price) tuples; a pair already breached keeps its
+        existing event.
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            for user_id, coin_id, *event in breaches:
+                cursor = self.db.execute("INSERT OR IGNORE INTO alert_state VALUES (?, ?)", (user_id, coin_id))
+                if cursor.rowcount:
+                    self.db.execute(
+                        "INSERT INTO alert_events "
+                        "(user_id, coin_id, name, symbol, threshold, rule, level, change, value, price, created) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (user_id, coin_id, *event, now)
+                    )
+            self.db.executemany("DELETE FROM alert_state WHERE user_id = ? AND coin_id = ?", cleared)
+            self.db.execute("DELETE FROM alert_events WHERE created < ?", (now - ALERT_EVENT_RETENTION,))
+            self.db.execute("COMMIT")
+
+    def pending_alerts(self, user_id):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, coin_id, name, symbol, threshold, rule, level, change, value, price FROM alert_events "
+                "WHERE user_id = ? AND status = 'pending' ORDER BY id",
+                (user_id,)
+            ).fetchall()
+        return [
+            {"event_id": event_id, "coin_id": coin_id, "name": name, "symbol": symbol, "threshold": threshold,
+             "rule": rule or "24h", "level": level, "change": change or 0.0,
+             "value": change if value is None else value, "price": price}
+            for event_id, coin_id, name, symbol, threshold, rule, level, change, value, price in rows
+        ]
+
+    def dismiss_alert(self, user_id, event_id):
+        with self.lock:
+            self.db.execute(
+                "UPDATE alert_events SET status = 'dismissed' WHERE user_id = ? AND id = ?", (user_id, event_id)
+            )
+
+    def settings(self, user_id):
+        with self.lock:
+            rows = self.db.execute("SELECT key, value FROM settings WHERE user_id = ?", (user_id,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set_setting(self, user_id, key, value):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?, ?)", (user_id, key, json.dumps(value)))
+
+@st.cache_resource
+def get_user_store():
+    return UserStore(USER_DB_FILE)
+
+def current_user_id():
+    """This visitor's token, kept in the URL so a reload or bookmark finds the same watchlist"""
+    if "user_id" not in st.session_state:
+        user_id = st.query_params.get(USER_PARAM)
+        if not user_id:
+            user_id = uuid.uuid4().hex
+            st.query_params[USER_PARAM] = user_id
+        st.session_state.user_id = user_id
+    return st.session_state.user_id
+
+def add_to_watchlist(coin_id, name, symbol, threshold=10):
+    st.session_state.watchlist[coin_id] = {
+        "name": name, "symbol": symbol, "threshold": threshold, "rule": "24h", "level": None
+    }
+    get_user_store().add_coin(current_user_id(), coin_id, name, symbol, threshold)
+    start_alert_worker().wake()
+
+def remove_from_watchlist(coin_id):
+    st.session_state.watchlist.pop(coin_id, None)
+    get_user_store().remove_coin(current_user_id(), coin_id)
+
+def set_alert_threshold(coin_id, threshold):
+    st.session_state.watchlist[coin_id]["threshold"] = threshold
+    get_user_store().set_threshold(current_user_id(), coin_id, threshold)
+    start_alert_worker().wake()
+
+def set_alert_rule(coin_id, rule, threshold, level=None):
+    st.session_state.watchlist[coin_id].update(rule=rule, threshold=threshold, level=level)
+    get_user_store().set_rule(current_user_id(), coin_id, rule, threshold, level)
+    start_alert_worker().wake()
+
+def save_setting(key, value):
+    st.session_state.settings[key] = value
+    get_user_store().set_setting(current_user_id(), key, value)
 
 def t(key):
     """Get translation for current language"""
     lang = st.session_state.get("language", "en")
     return TRANSLATIONS.get(lang, TRANSLATIONS["en"]).get(key, key)
 
+def stale_caption(age):
+    """Marker under data served past its cache ttl while it refreshes"""
+    if age:
+        st.caption(f"⏳ {t('stale_data').format(minutes=max(1, round(age / 60)))}")
+
 # Initialize session state
 if "watchlist" not in st.session_state:
-    st.session_state.watchlist = load_watchlist()
+    st.session_state.watchlist = get_user_store().watchlist(current_user_id())
 if "settings" not in st.session_state:
-    st.session_state.settings = load_settings()
+    st.session_state.settings = get_user_store().settings(current_user_id())
 if "language" not in st.session_state:
     st.session_state.language = st.session_state.settings.get("language", None)
 if "acknowledged_alerts" not in st.session_state:
     st.session_state.acknowledged_alerts = set()
 if "editing_threshold" not in st.session_state:
     st.session_state.editing_threshold = None
-if "rate_limit_until" not in st.session_state:
-    st.session_state.rate_limit_until = 0
-if "prices_cache" not in st.session_state:
-    st.session_state.prices_cache = {}
-if "prices_cache_time" not in st.session_state:
-    st.session_state.prices_cache_time = 0
-if "popup_alerts" not in st.session_state:
-    st.session_state.popup_alerts = []
-if "dismissed_popups" not in st.session_state:
-    st.session_state.dismissed_popups = set()
-if "first_load" not in st.session_state:
-    st.session_state.first_load = True
-
-# Rate limit functions
-def is_rate_limited():
-    return st.session_state.rate_limit_until > 0
+if "alert_vibes_prefetched" not in st.session_state:
+    st.session_state.alert_vibes_prefetched = set()
+
+def config_value(key, default):
+    """Read a tuning knob from the environment or secrets.toml, falling back to default"""
+    value = os.environ.get(key)
+    if value is None:
+        try:
+            value = st.secrets.get(key)
+        except Exception:
+            value = None
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return str(value).lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
+
+# Metrics
+# Prometheus histogram buckets for span durations, in seconds
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_PREFIX = "vibe_check"
+
+class Metrics:
+    """Process-wide span timings, cache hit/miss counts, upstream response codes and failures.
+
+    Every session, the fetch pool and the background workers record into the
+    same instance; the debug panel and the Prometheus exporter read snapshots.
+    Components with their own counts (the vibe cache) register a collector
+    that is read as gauges at snapshot time.
+    Sessions being profiled also get their own spans traced, from any thread
+    running on their behalf.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.caches = Counter()
+        self.upstream = Counter()
+        self.failures = Counter()
+        self.collectors = {}
+        self.traces = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {"count": 0, "sum": 0.0, "max": 0.0, "last": 0.0,
+                                           "buckets": [0] * len(SPAN_BUCKETS)}
+            span["count"] += 1
+            span["sum"] += seconds
+            span["max"] = max(span["max"], seconds)
+            span["last"] = seconds
+            index = bisect.bisect_left(SPAN_BUCKETS, seconds)
+            if index < len(SPAN_BUCKETS):
+                span["buckets"][index] += 1
+
+    def start_trace(self, session_id):
+        with self.lock:
+            self.traces[session_id] = []
+
+    def stop_trace(self, session_id):
+        with self.lock:
+            return self.traces.pop(session_id, [])
+
+    def trace(self, name, seconds):
+        ctx = get_script_run_ctx(suppress_warning=True)
+        spans = self.traces.get(ctx.session_id) if ctx else None
+        if spans is not None:
+            spans.append((name, seconds))
+
+    def count_cache(self, function, result):
+        with self.lock:
+            self.caches[(function, result)] += 1
+
+    def count_upstream(self, api, route, status):
+        with self.lock:
+            self.upstream[(api, route, str(status))] += 1
+
+    def count_failure(self, task, error):
+        """A background task or fetch that gave up on an exception, by exception type"""
+        with self.lock:
+            self.failures[(task, type(error).__name__)] += 1
+
+    def add_collector(self, name, collect):
+        """Report collect()'s {name: number} dict as <name>_<key> gauges"""
+        with self.lock:
+            self.collectors[name] = collect
+
+    def gauges(self):
+        with self.lock:
+            collectors = dict(self.collectors)
+        return {f"{name}_{key}": value for name, collect in collectors.items() for key, value in collect().items()}
+
+    def snapshot(self):
+        with self.lock:
+            spans = {name: dict(span, buckets=list(span["buckets"])) for name, span in self.spans.items()}
+            return spans, Counter(self.caches), Counter(self.upstream), Counter(self.failures)
+
+    def prometheus_text(self):
+        """Everything recorded so far in the Prometheus text exposition format"""
+        spans, caches, upstream, failures = self.snapshot()
+        lines = [
+            f"# HELP {METRICS_PREFIX}_span_seconds Time spent in fetchers, vibe checks and render phases",
+            f"# TYPE {METRICS_PREFIX}_span_seconds histogram",
+        ]
+        for name, span in sorted(spans.items()):
+            cumulative = 0
+            for bound, count in zip(SPAN_BUCKETS, span["buckets"]):
+                cumulative += count
+                lines.append(f'{METRICS_PREFIX}_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRICS_PREFIX}_span_seconds_bucket{{span="{name}",le="+Inf"}} {span["count"]}')
+            lines.append(f'{METRICS_PREFIX}_span_seconds_sum{{span="{name}"}} {span["sum"]:.6f}')
+            lines.append(f'{METRICS_PREFIX}_span_seconds_count{{span="{name}"}} {span["count"]}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_cache_requests_total Cached function calls by result (hit, stale or miss)",
+            f"# TYPE {METRICS_PREFIX}_cache_requests_total counter",
+        ]
+        for (function, result), count in sorted(caches.items()):
+            lines.append(f'{METRICS_PREFIX}_cache_requests_total{{function="{function}",result="{result}"}} {count}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_upstream_responses_total Upstream API responses by status; error means no response",
+            f"# TYPE {METRICS_PREFIX}_upstream_responses_total counter",
+        ]
+        for (api, route, status), count in sorted(upstream.items()):
+            lines.append(
+                f'{METRICS_PREFIX}_upstream_responses_total{{api="{api}",route="{route}",status="{status}"}} {count}'
+            )
+        lines += [
+            f"# HELP {METRICS_PREFIX}_failures_total Fetches and background tasks abandoned on an exception",
+            f"# TYPE {METRICS_PREFIX}_failures_total counter",
+        ]
+        for (task, error), count in sorted(failures.items()):
+            lines.append(f'{METRICS_PREFIX}_failures_total{{task="{task}",error="{error}"}} {count}')
+        for name, value in sorted(self.gauges().items()):
+            lines += [f"# TYPE {METRICS_PREFIX}_{name} gauge", f"{METRICS_PREFIX}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+@st.cache_resource
+def get_metrics():
+    return Metrics()
+
+@contextmanager
+def span(name):
+    """Time the enclosed block into the named span, even when it raises or reruns"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = get_metrics()
+        seconds = time.perf_counter() - started
+        metrics.observe(name, seconds)
+        if metrics.traces:
+            metrics.trace(name, seconds)
+
+def timed(name):
+    """Decorator form of span; under @st.fragment it also times every fragment rerun.
+
+    Generators are timed from the first value to the last, e.g. a whole stream.
+    """
+    def decorate(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    yield from fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Per-thread stack of "did the cached body run" flags for metered_cache calls in flight
+cache_calls = threading.local()
+
+def metered_cache(**cache_kwargs):
+    """st.cache_data that times every call as fetch.<name> and counts hits and misses.
+
+    A call is a miss when st.cache_data ran the function body; .clear() is the
+    cached function's own.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def compute(*args, **kwargs):
+            cache_calls.stack[-1] = True
+            return fn(*args, **kwargs)
+
+        cached = st.cache_data(show_spinner=False, **cache_kwargs)(compute)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if not hasattr(cache_calls, "stack"):
+                cache_calls.stack = []
+            cache_calls.stack.append(False)
+            try:
+                with span(f"fetch.{fn.__name__}"):
+                    return cached(*args, **kwargs)
+            finally:
+                get_metrics().count_cache(fn.__name__, "miss" if cache_calls.stack.pop() else "hit")
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+def upstream_route(path):
+    """An API path without its query string, with per-coin segments collapsed"""
+    return re.sub(r"/coins/(?!list|markets)[^/]+/", "/coins/:id/", path.split("?", 1)[0])
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
 
-def set_rate_limit():
-    st.session_state.rate_limit_until = time.time()
+@st.cache_resource
+def start_metrics_exporter():
+    """Export metrics for Prometheus when configured; runs once per process.
+
+    METRICS_PORT serves /metrics on METRICS_HOST (localhost by default);
+    METRICS_FILE is rewritten every METRICS_FILE_INTERVAL seconds, e.g. for
+    node_exporter's textfile collector.
+    """
+    metrics = get_metrics()
+    port = config_value("METRICS_PORT", 0)
+    if port:
+        try:
+            server = ThreadingHTTPServer((config_value("METRICS_HOST", "127.0.0.1"), port), MetricsHandler)
+            server.daemon_threads = True
+            server.metrics = metrics
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        except OSError as e:
+            logger.warning("Metrics port %s unavailable: %s", port, e)
+
+    path = config_value("METRICS_FILE", "")
+    if path:
+        interval = config_value("METRICS_FILE_INTERVAL", 15)
+
+        def write_forever():
+            while True:
+                try:
+                    atomic_write_text(path, metrics.prometheus_text())
+                except OSError as e:
+                    logger.warning("Could not write metrics to %s: %s", path, e)
+                time.sleep(interval)
+
+        threading.Thread(target=write_forever, name="metrics-file", daemon=True).start()
+    return True
+
+def metrics_panel():
+    """Sidebar debug panel with the aggregates; shown when METRICS_PANEL is on"""
+    spans, caches, upstream, failures = get_metrics().snapshot()
+    with st.sidebar.expander("📊 Metrics"):
+        st.markdown("**Spans**")
+        st.dataframe([
+            {"span": name, "calls": s["count"], "mean ms": round(1000 * s["sum"] / s["count"], 1),
+             "max ms": round(1000 * s["max"], 1), "last ms": round(1000 * s["last"], 1)}
+            for name, s in sorted(spans.items(), key=lambda item: -item[1]["sum"])
+        ], hide_index=True)
+        st.markdown("**Caches**")
+        functions = sorted({function for function, _ in caches})
+        st.dataframe([
+            {"function": f, "hits": caches[(f, "hit")], "stale": caches[(f, "stale")], "misses": caches[(f, "miss")],
+             "hit rate": f"{(caches[(f, 'hit')] + caches[(f, 'stale')]) / max(1, sum(caches[(f, r)] for r in ('hit', 'stale', 'miss'))):.0%}"}
+            for f in functions
+        ], hide_index=True)
+        st.markdown("**Upstream responses**")
+        st.dataframe([
+            {"api": api, "route": route, "status": status, "count": count}
+            for (api, route, status), count in sorted(upstream.items())
+        ], hide_index=True)
+        gauges = get_metrics().gauges()
+        if gauges:
+            st.markdown("**Gauges**")
+            st.dataframe([{"gauge": name, "value": value} for name, value in sorted(gauges.items())], hide_index=True)
+        if failures:
+            st.markdown("**Failures**")
+            st.dataframe([
+                {"task": task, "error": error, "count": count}
+                for (task, error), count in sorted(failures.items())
+            ], hide_index=True)
+
+# Shared HTTP client; both base URLs can point at a local stand-in (see benchmarks/)
+COINGECKO_API = config_value("COINGECKO_API", "https://api.coingecko.com/api/v3")
+GROQ_API = config_value("GROQ_API", "https://api.groq.com/openai/v1")
+
+# (connect, read) timeouts - fail fast on dead hosts, stay patient with slow bodies
+CONNECT_TIMEOUT = 3.05
+API_TIMEOUT = (CONNECT_TIMEOUT, 10)
+PING_TIMEOUT = (CONNECT_TIMEOUT, 5)
+LLM_TIMEOUT = (CONNECT_TIMEOUT, 15)
+
+@st.cache_resource
+def get_http_session():
+    """Process-wide keep-alive session with a sized connection pool per API host"""
+    session = requests.Session()
+    session.headers.update({"Accept": "application/json", "Connection": "keep-alive"})
+    session.mount(COINGECKO_API, HTTPAdapter(pool_connections=1, pool_maxsize=32, max_retries=0))
+    session.mount(GROQ_API, HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=0))
+    return session
+
+# CoinGecko request scheduler
+PRIORITY_ALERTS = 0
+PRIORITY_SEARCH = 1
+PRIORITY_MARKET = 2
+PRIORITY_BACKGROUND = 3
+
+# Seconds a caller may queue for a token before giving up on the call
+SCHEDULER_MAX_WAIT = {
+    PRIORITY_ALERTS: 10,
+    PRIORITY_SEARCH: 10,
+    PRIORITY_MARKET: 3,
+    PRIORITY_BACKGROUND: 60,
+}
+
+class RateBudgetExceeded(Exception):
+    """No CoinGecko call budget became available within the caller's wait limit.
+
+    This is our own bucket running dry, not an upstream 429: callers report it
+    as "busy" and never trip the shared backoff.
+    """
+
+class RequestScheduler:
+    """Token bucket sized to the CoinGecko plan that grants tokens in priority order.
+
+    Waiters queue on a heap of (priority, arrival); only the head of the queue
+    may take a token, so bulk background work never jumps ahead of a search.
+    """
+
+    def __init__(self, calls_per_minute, burst):
+        self.rate = calls_per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.queue = []
+        self.arrivals = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority, max_wait):
+        deadline = time.monotonic() + max_wait
+        ticket = (priority, next(self.arrivals))
+        with self.cond:
+            heapq.heappush(self.queue, ticket)
+            try:
+                while True:
+                    self._refill()
+                    is_next = self.queue[0] == ticket
+                    if is_next and self.tokens >= 1:
+                        self.tokens -= 1
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    if is_next:
+                        remaining = min(remaining, (1 - self.tokens) / self.rate)
+                    self.cond.wait(remaining)
+            finally:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+                self.cond.notify_all()
+
+@st.cache_resource
+def get_request_scheduler():
+    return RequestScheduler(
+        config_value("COINGECKO_CALLS_PER_MINUTE", 30),
+        config_value("COINGECKO_BURST", 5)
+    )
 
-def clear_rate_limit():
-    st.session_state.rate_limit_until = 0
+def coingecko_get(path, priority, timeout=API_TIMEOUT, probe=False):
+    """GET a CoinGecko endpoint once the scheduler grants a token for this priority.
+
+    While the shared backoff is active only probe requests reach upstream; a
+    429 response (re)arms the backoff for every session. Callers arriving
+    after the window has passed start the recovery probe, so background
+    work recovers even with no page open. Probes skip the bucket, so an
+    exhausted budget can't keep the backoff from lifting.
+    """
+    backoff = get_rate_limit_backoff()
+    if not probe and not backoff.try_recover():
+        raise RateBudgetExceeded(path)
+    if not probe and not get_request_scheduler().acquire(priority, SCHEDULER_MAX_WAIT[priority]):
+        raise RateBudgetExceeded(path)
+    try:
+        response = get_http_session().get(f"{COINGECKO_API}{path}", timeout=timeout)
+    except Exception:
+        get_metrics().count_upstream("coingecko", upstream_route(path), "error")
+        raise
+    get_metrics().count_upstream("coingecko", upstream_route(path), response.status_code)
+    if response.status_code == 429:
+        backoff.trip(parse_retry_after(response.headers.get("Retry-After")))
+    return response
 
 def check_api_available():
     try:
-        response = requests.get("https://api.coingecko.com/api/v3/ping", timeout=5)
+        response = coingecko_get("/ping", PRIORITY_SEARCH, timeout=PING_TIMEOUT, probe=True)
         return response.status_code == 200
     except:
         return False
 
+# Shared rate-limit backoff
+BACKOFF_BASE = 5
+BACKOFF_MAX = 300
+RATE_LIMIT_POLL_INTERVAL = 2
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RateLimitBackoff:
+    """Process-wide 429 state shared by every session.
+
+    Each trip doubles the window (with jitter) unless the server told us how
+    long to wait. Once the window passes, a single background /ping probe
+    decides for everyone: success lifts the limit for all sessions at once,
+    failure arms the next, longer window.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.retry_at = 0
+        self.probing = False
+
+    def is_limited(self):
+        return self.retry_at > 0
+
+    def trip(self, retry_after=None):
+        with self.lock:
+            now = time.time()
+            if now < self.retry_at:
+                # Stragglers from the same burst only extend the current window
+                if retry_after is not None:
+                    self.retry_at = max(self.retry_at, now + retry_after)
+                return
+            self.failures += 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            if retry_after is not None:
+                delay = retry_after
+            self.retry_at = now + delay
+
+    def clear(self):
+        with self.lock:
+            self.failures = 0
+            self.retry_at = 0
+
+    def try_recover(self):
+        """Start the recovery probe if the window has passed; True once no longer limited"""
+        with self.lock:
+            if not self.retry_at:
+                return True
+            if self.probing or time.time() < self.retry_at:
+                return False
+            self.probing = True
+        threading.Thread(target=self._probe, daemon=True).start()
+        return False
+
+    def _probe(self):
+        try:
+            available = check_api_available()
+        finally:
+            with self.lock:
+                self.probing = False
+        if available:
+            self.clear()
+        else:
+            self.trip()
+
+@st.cache_resource
+def get_rate_limit_backoff():
+    return RateLimitBackoff()
+
+def is_rate_limited():
+    """True while the shared backoff holds; a check after the window has passed starts the probe"""
+    return not get_rate_limit_backoff().try_recover()
+
+def set_rate_limit():
+    get_rate_limit_backoff().trip()
+
+@st.fragment(run_every=RATE_LIMIT_POLL_INTERVAL)
+def rate_limit_watcher():
+    """Polls the shared backoff without holding the script thread"""
+    if get_rate_limit_backoff().try_recover():
+        st.rerun(scope="app")
+
+# Stale-while-revalidate cache
+# Seconds before a fetch that failed is tried again; until then callers get the error at once
+SWR_RETRY_INTERVAL = 30
+
+class UpstreamError(Exception):
+    """A fetch that got no usable answer; it is reported, never cached as a value"""
+
+    def __init__(self, status, message):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+def coingecko_json(path, priority):
+    """GET and decode a CoinGecko endpoint, raising UpstreamError for anything but a 200"""
+    try:
+        response = coingecko_get(path, priority)
+    except RateBudgetExceeded:
+        raise UpstreamError("busy", "Request budget exhausted")
+    except Exception:
+        raise UpstreamError(0, "Connection error")
+    if response.status_code != 200:
+        raise UpstreamError(response.status_code, response.text)
+    try:
+        return response.json()
+    except ValueError:
+        raise UpstreamError(response.status_code, "Invalid JSON")
+
+class StaleWhileRevalidate:
+    """Last good result per call of one fetcher, shared by every session.
+
+    Within ttl a result is fresh. For up to max_stale seconds past that it is
+    still returned at once while a single background thread refetches it;
+    older results are refetched inline. A failed fetch never replaces a good
+    result, and the same call isn't retried for SWR_RETRY_INTERVAL seconds
+    unless it only failed for want of a budget token.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.failures = {}
+        self.refreshing = set()
+
+    def get(self, fn, args, ttl, max_stale, on_error):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(args)
+            failure = self.failures.get(args)
+        if failure and now - failure[1] >= SWR_RETRY_INTERVAL:
+            failure = None
+        age = now - entry[1] if entry else None
+        if entry and age < ttl:
+            get_metrics().count_cache(self.name, "hit")
+            return entry[0]
+        if entry and age < ttl + max_stale:
+            get_metrics().count_cache(self.name, "stale")
+            if not failure:
+                self.revalidate(fn, args, ttl + max_stale)
+            return entry[0]
+        get_metrics().count_cache(self.name, "miss")
+        if failure:
+            return on_error(failure[0])
+        try:
+            return self.fetch(fn, args, ttl + max_stale)
+        except UpstreamError as e:
+            return on_error(e)
+
+    def fetch(self, fn, args, keep_for):
+        try:
+            value = fn(*args)
+        except UpstreamError as e:
+            if e.status != "busy":
+                with self.lock:
+                    self.failures[args] = (e, time.time())
+            raise
+        now = time.time()
+        with self.lock:
+            self.failures.pop(args, None)
+            self.entries = {k: v for k, v in self.entries.items() if now - v[1] < keep_for}
+            self.entries[args] = (value, now)
+        return value
+
+    def revalidate(self, fn, args, keep_for):
+        with self.lock:
+            if args in self.refreshing:
+                return
+            self.refreshing.add(args)
+
+        def refresh():
+            try:
+                with span(f"refresh.{self.name}"):
+                    self.fetch(fn, args, keep_for)
+            except Exception:
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing.discard(args)
+
+        threading.Thread(target=refresh, name=f"refresh-{self.name}", daemon=True).start()
+
+    def age(self, args):
+        with self.lock:
+            entry = self.entries.get(args)
+        return time.time() - entry[1] if entry else None
+
+    def clear(self, args):
+        with self.lock:
+            if args:
+                self.entries.pop(args, None)
+                self.failures.pop(args, None)
+            else:
+                self.entries.clear()
+                self.failures.clear()
+
+@st.cache_resource
+def swr_store(name):
+    return StaleWhileRevalidate(name)
+
+def stale_while_revalidate(ttl, max_stale, on_error):
+    """Serve a fetcher through a process-wide StaleWhileRevalidate store.
+
+    The fetcher raises UpstreamError on failure; on_error(error) builds what
+    callers get when no usable result is cached. Calls are timed as
+    fetch.<name> and counted as hit, stale or miss. .staleness(*args) is the
+    age in seconds of a result served past its ttl (0 when fresh), for the UI.
+    """
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        def key(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return tuple(bound.arguments.values())
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            with span(f"fetch.{fn.__name__}"):
+                return swr_store(fn.__name__).get(fn, key(args, kwargs), ttl, max_stale, on_error)
+
+        def staleness(*args, **kwargs):
+            age = swr_store(fn.__name__).age(key(args, kwargs))
+            return age if age is not None and age >= ttl else 0
+
+        call.staleness = staleness
+        call.clear = lambda *args, **kwargs: swr_store(fn.__name__).clear(key(args, kwargs) if args or kwargs else ())
+        return call
+    return decorate
+
 # Cached API functions
-@st.cache_data(ttl=600, show_spinner=False)
+@metered_cache(ttl=600)
 def search_coin(query):
     try:
-        response = requests.get(f"https://api.coingecko.com/api/v3/search?query={query}", timeout=10)
+        response = coingecko_get(f"/search?query={query}", PRIORITY_SEARCH)
         if response.status_code == 200:
             return response.json()
         return {"error": response.status_code, "message": response.text}
+    except RateBudgetExceeded:
+        return {"error": "busy", "message": "Request budget exhausted"}
     except:
         return {"error": 0, "message": "Connection error"}
 
-@st.cache_data(ttl=120, show_spinner=False)
+@stale_while_revalidate(
+    ttl=120, max_stale=config_value("PRICE_MAX_STALENESS", 900),
+    on_error=lambda e: {"error": e.status, "message": e.message}
+)
 def get_price(coin_id):
-    try:
-        response = requests.get(
-            f"https://api.coingecko.com/api/v3/simple/price?ids={coin_id}&vs_currencies=usd&include_24hr_change=true",
-            timeout=10
-        )
-        if response.status_code == 200:
-            return response.json()
-        return {"error": response.status_code, "message": response.text}
-    except:
-        return {"error": 0, "message": "Connection error"}
+    return coingecko_json(
+        f"/simple/price?ids={coin_id}&vs_currencies=usd&include_24hr_change=true",
+        PRIORITY_SEARCH
+    )
 
-@st.cache_data(ttl=300, show_spinner=False)
+def chart_columns(points):
+    """CoinGecko [[ms, price], ...] pairs as (int64 epoch-ms, float64 price) arrays"""
+    samples = np.array(points, dtype=np.float64).reshape(-1, 2)
+    samples = samples[~np.isnan(samples[:, 1])]
+    return samples[:, 0].astype(np.int64), samples[:, 1]
+
+@stale_while_revalidate(
+    ttl=300, max_stale=config_value("CHART_MAX_STALENESS", 3600),
+    on_error=lambda e: None
+)
 def get_coin_chart(coin_id, days=7):
-    """Get price history for chart"""
-    try:
-        response = requests.get(
-            f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart?vs_currency=usd&days={days}",
-            timeout=10
-        )
-        if response.status_code == 200:
-            data = response.json()
-            prices = data.get("prices", [])
-            return [(datetime.fromtimestamp(p[0]/1000), p[1]) for p in prices]
-        return []
-    except:
-        return []
+    """Get price history for chart as columnar (epoch-ms, price) arrays, or None on failure"""
+    data = coingecko_json(
+        f"/coins/{coin_id}/market_chart?vs_currency=usd&days={days}",
+        PRIORITY_ALERTS
+    )
+    return chart_columns(data.get("prices", []))
 
-@st.cache_data(ttl=300, show_spinner=False)
+@stale_while_revalidate(
+    ttl=300, max_stale=config_value("TRENDING_MAX_STALENESS", 3600),
+    on_error=lambda e: []
+)
 def get_trending_coins():
     """Get trending coins from CoinGecko"""
-    try:
-        response = requests.get(
-            "https://api.coingecko.com/api/v3/search/trending",
-            timeout=10
-        )
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("coins", [])[:7]
-        return []
-    except:
-        return []
+    return coingecko_json("/search/trending", PRIORITY_MARKET).get("coins", [])[:7]
 
-@st.cache_data(ttl=300, show_spinner=False)
+@metered_cache(ttl=300)
 def get_global_market_data():
     """Get global crypto market data"""
     try:
-        response = requests.get(
-            "https://api.coingecko.com/api/v3/global",
-            timeout=10
+        response = coingecko_get(
+            "/global",
+            PRIORITY_MARKET
         )
         if response.status_code == 200:
             return response.json().get("data", {})
@@ -412,13 +1374,13 @@ def get_global_market_data():
     except:
         return {}
 
-@st.cache_data(ttl=120, show_spinner=False)
+@metered_cache(ttl=120)
 def get_top_coins_data():
     """Get top 6 coins with price data for homepage"""
     try:
-        response = requests.get(
-            "https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&order=market_cap_desc&per_page=6&page=1&sparkline=false",
-            timeout=10
+        response = coingecko_get(
+            "/coins/markets?vs_currency=usd&order=market_cap_desc&per_page=6&page=1&sparkline=false",
+            PRIORITY_MARKET
         )
         if response.status_code == 200:
             return response.json()
@@ -426,51 +1388,719 @@ def get_top_coins_data():
     except:
         return []
 
+# Chart data service
+# (window in days, resolution in seconds, point budget) from newest to oldest;
+# each level only covers the span beyond the previous one
+CHART_LEVELS = [
+    (7, 3600, 120),
+    (30, 4 * 3600, 60),
+    (365, 24 * 3600, 120),
+]
+CHART_HOURLY_DAYS = 90
+
+def resample_last(ts, prices, resolution_ms):
+    """Keep the last sample in every resolution_ms bucket of a sorted series"""
+    if len(ts) == 0:
+        return ts, prices
+    buckets = ts // resolution_ms
+    last = np.flatnonzero(np.append(buckets[1:] != buckets[:-1], True))
+    return ts[last], prices[last]
+
+def lttb(ts, prices, threshold):
+    """Largest-Triangle-Three-Buckets downsampling to at most threshold points"""
+    n = len(ts)
+    if threshold >= n or threshold < 3:
+        return ts, prices
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    x, y = ts.astype(np.float64), prices
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean() if next_end > end else x[-1]
+        avg_y = y[end:next_end].mean() if next_end > end else y[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return ts[keep], prices[keep]
+
+# Local price history store
+HISTORY_FILE = os.path.join(DATA_DIR, "price_history.sqlite3")
+HISTORY_REFRESH_INTERVAL = 300
+# Seconds after which the alert chart's newest point is shown as stale
+CHART_STALE_AFTER = 2 * 3600
+HISTORY_DAYS = 365
+
+def fetch_chart_range(coin_id, from_ts, to_ts):
+    """Columnar samples between two epoch-second timestamps, or None on failure"""
+    try:
+        response = coingecko_get(
+            f"/coins/{coin_id}/market_chart/range?vs_currency=usd&from={int(from_ts)}&to={int(to_ts)}",
+            PRIORITY_ALERTS
+        )
+        if response.status_code == 200:
+            return chart_columns(response.json().get("prices", []))
+        return None
+    except Exception as e:
+        get_metrics().count_failure("history.fetch_chart_range", e)
+        return None
+
+class PriceHistoryStore:
+    """Per-coin price history kept in SQLite and topped up with delta fetches.
+
+    The first sync backfills a year (daily) plus the last 90 days (hourly);
+    later syncs only ask /market_chart/range for what came after the newest
+    stored sample. Old samples are thinned to hourly and then daily so the
+    store stays about as dense as the chart levels that read it.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS prices ("
+            "coin_id TEXT, ts INTEGER, price REAL, PRIMARY KEY (coin_id, ts)) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS coverage (coin_id TEXT PRIMARY KEY, last_ts INTEGER, synced_at REAL)"
+        )
+
+    def sync(self, coin_id):
+        """Fetch whatever is missing since the last stored sample, at most once per interval"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT last_ts, synced_at FROM coverage WHERE coin_id = ?", (coin_id,)
+            ).fetchone()
+        now = time.time()
+        if row and now - row[1] < HISTORY_REFRESH_INTERVAL:
+            return
+
+        if row:
+            samples = fetch_chart_range(coin_id, row[0] / 1000, now)
+        else:
+            # Both halves or nothing: coverage written after half a backfill would never be filled in
+            hourly = get_coin_chart(coin_id, CHART_HOURLY_DAYS)
+            daily = get_coin_chart(coin_id, HISTORY_DAYS)
+            if hourly is None or daily is None:
+                return
+            samples = (np.concatenate([daily[0], hourly[0]]), np.concatenate([daily[1], hourly[1]]))
+        if samples is None or len(samples[0]) == 0:
+            return
+
+        ts, prices = samples
+        last_ts = max(int(ts.max()), row[0] if row else 0)
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO prices VALUES (?, ?, ?)",
+                zip(itertools.repeat(coin_id), ts.tolist(), prices.tolist())
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)", (coin_id, last_ts, now)
+            )
+            self._compact(coin_id, last_ts)
+            self.db.execute("COMMIT")
+
+    def _compact(self, coin_id, last_ts):
+        day_ms = 86400 * 1000
+        for older_than, resolution in ((last_ts - day_ms, 3600 * 1000),
+                                       (last_ts - CHART_HOURLY_DAYS * day_ms, day_ms)):
+            self.db.execute(
+                "DELETE FROM prices WHERE coin_id = ? AND ts < ? AND ts NOT IN ("
+                "SELECT MAX(ts) FROM prices WHERE coin_id = ? AND ts < ? GROUP BY ts / ?)",
+                (coin_id, older_than, coin_id, older_than, resolution)
+            )
+        self.db.execute(
+            "DELETE FROM prices WHERE coin_id = ? AND ts < ?", (coin_id, last_ts - HISTORY_DAYS * day_ms)
+        )
+
+    def series(self, coin_id):
+        """Stored (epoch-ms, price) arrays for a coin, oldest first"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT ts, price FROM prices WHERE coin_id = ? ORDER BY ts", (coin_id,)
+            ).fetchall()
+        ts = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        prices = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        return ts, prices
+
+@st.cache_resource
+def get_price_history_store():
+    return PriceHistoryStore(HISTORY_FILE)
+
+@metered_cache(ttl=300)
+def get_chart_series(coin_id):
+    """Columnar (epoch-ms, price) history for the alert chart, at a resolution matched to each zoom window.
+
+    The last 7 days come hourly, up to 30 days 4-hourly and the rest of the
+    year daily, each LTTB-downsampled to its point budget, so the 7D view is
+    detailed while the whole year ships in a few hundred points. Samples are
+    read from the local history store after a delta sync.
+    """
+    store = get_price_history_store()
+    store.sync(coin_id)
+    ts, prices = store.series(coin_id)
+    if len(ts) == 0:
+        return ts, prices
+
+    segments = []
+    newer_than = ts[-1] + 1
+    for days, resolution, budget in CHART_LEVELS:
+        start = ts[-1] - days * 86400 * 1000
+        mask = (ts >= start) & (ts < newer_than)
+        segments.insert(0, lttb(*resample_last(ts[mask], prices[mask], resolution * 1000), budget))
+        newer_than = start
+    return np.concatenate([seg[0] for seg in segments]), np.concatenate([seg[1] for seg in segments])
+
+# Rolling alert rules
+ALERT_RULES = ["24h", "5m", "1h", "4h", "zscore", "above", "below"]
+RULE_WINDOWS = {"5m": 5 * 60, "1h": 3600, "4h": 4 * 3600}
+PERCENT_RULES = {"24h", *RULE_WINDOWS}
+LEVEL_RULES = {"above", "below"}
+RULE_SLIDER_MAX = {"zscore": 10}
+RULE_MIN_TICK_INTERVAL = 30
+ZSCORE_WINDOW = "4h"
+ZSCORE_MIN_RETURNS = 10
+
+class RollingWindow:
+    """Ring buffer of the price ticks from the last `span` seconds, with running sums.
+
+    A push evicts expired ticks from the head before appending, so every tick
+    is added and removed exactly once and each statistic is O(1) to read,
+    however long the window. Log returns are summed for the z-score; a
+    coin's first tick has no return and is stored as NaN.
+    """
+
+    def __init__(self, span):
+        self.span = span
+        self.capacity = span // RULE_MIN_TICK_INTERVAL + 1
+        self.times = [0.0] * self.capacity
+        self.prices = [0.0] * self.capacity
+        self.returns = [math.nan] * self.capacity
+        self.head = 0
+        self.size = 0
+        self.return_count = 0
+        self.return_sum = 0.0
+        self.return_sq_sum = 0.0
+
+    def push(self, ts, price, log_return):
+        while self.size and (self.size == self.capacity or self.times[self.head] <= ts - self.span):
+            self.pop()
+        i = (self.head + self.size) % self.capacity
+        self.times[i], self.prices[i], self.returns[i] = ts, price, log_return
+        self.size += 1
+        if log_return == log_return:
+            self.return_count += 1
+            self.return_sum += log_return
+            self.return_sq_sum += log_return * log_return
+
+    def pop(self):
+        log_return = self.returns[self.head]
+        if log_return == log_return:
+            self.return_count -= 1
+            self.return_sum -= log_return
+            self.return_sq_sum -= log_return * log_return
+        self.head = (self.head + 1) % self.capacity
+        self.size -= 1
+
+    def newest(self):
+        return (self.head + self.size - 1) % self.capacity
+
+    def change(self):
+        """Percent move from the oldest tick to the newest, once they span half the window"""
+        if self.size < 2:
+            return None
+        last = self.newest()
+        if self.times[last] - self.times[self.head] < self.span / 2:
+            return None
+        return (self.prices[last] / self.prices[self.head] - 1) * 100
+
+    def zscore(self):
+        """How many standard deviations the newest return sits from the window's mean return"""
+        n = self.return_count
+        if n < ZSCORE_MIN_RETURNS:
+            return None
+        mean = self.return_sum / n
+        # Running sums can drift slightly below zero when returns are all equal
+        variance = max(self.return_sq_sum / n - mean * mean, 0.0)
+        last = self.returns[self.newest()]
+        if variance == 0 or last != last:
+            return None
+        return (last - mean) / math.sqrt(variance)
+
+class PriceStream:
+    """One coin's ticks fanned out to a RollingWindow per rule window"""
+
+    def __init__(self):
+        self.windows = {name: RollingWindow(span) for name, span in RULE_WINDOWS.items()}
+        self.last_time = None
+        self.last_price = None
+
+    def push(self, ts, price):
+        if not price or price <= 0:
+            return
+        if self.last_time is not None and ts - self.last_time < RULE_MIN_TICK_INTERVAL:
+            return
+        log_return = math.log(price / self.last_price) if self.last_price else math.nan
+        for window in self.windows.values():
+            window.push(ts, price, log_return)
+        self.last_time, self.last_price = ts, price
+
+    def stats(self):
+        stats = {name: window.change() for name, window in self.windows.items()}
+        stats["zscore"] = self.windows[ZSCORE_WINDOW].zscore()
+        return stats
+
+def rule_values(rules, quotes, stats):
+    """The number each row's rule is judged on, as float64 with NaN where there is no reading yet.
+
+    Percent rules read a percent change, "zscore" a z-score and the level
+    rules the current price.
+    """
+    def value(rule, quote, coin_stats):
+        if rule == "24h":
+            return quote.get("usd_24h_change")
+        if rule in LEVEL_RULES:
+            return quote.get("usd")
+        return coin_stats.get(rule)
+    values = (value(rule, quote or {}, coin_stats or {}) for rule, quote, coin_stats in zip(rules, quotes, stats))
+    return np.fromiter((math.nan if v is None else v for v in values), dtype=np.float64, count=len(rules))
+
+def rule_breaches(rules, thresholds, levels, values):
+    """Vectorized breach test for mixed rules; NaN readings never breach"""
+    rules = np.asarray(rules, dtype=object)
+    levels = np.fromiter((math.nan if level is None else level for level in levels), dtype=np.float64, count=len(rules))
+    with np.errstate(invalid="ignore"):
+        magnitude = (values != 0) & (np.abs(values) >= thresholds)
+        above = values >= levels
+        below = values <= levels
+    return np.where(rules == "above", above, np.where(rules == "below", below, magnitude))
+
+def format_rule_value(rule, value):
+    if value is None or value != value:
+        return "…"
+    if rule == "zscore":
+        return f"z {value:+.2f}"
+    if rule in LEVEL_RULES:
+        return f"${value:,.2f}"
+    return f"{value:+.2f}%"
+
+def format_rule_target(rule, threshold, level):
+    if rule == "zscore":
+        return f"|z| ≥ {threshold}"
+    if rule == "above":
+        return f"≥ ${level or 0:,.2f}"
+    if rule == "below":
+        return f"≤ ${level or 0:,.2f}"
+    return f"±{threshold}%"
+
+# Shared watchlist price hub
+PRICE_REFRESH_INTERVAL = 120
+PRICE_RETRY_INTERVAL = 15
+PRICE_BATCH_SIZE = 250
+SUBSCRIBER_IDLE_TIMEOUT = 600
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+class PriceHub:
+    """Keeps one price snapshot for the union of every session's watchlist.
+
+    Whichever session finds the snapshot expired refreshes it for everyone with
+    one batched /simple/price call, so upstream traffic scales with distinct
+    coins instead of open tabs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.subscribers = {}
+        self.snapshot = {}
+        self.streams = {}
+        self.refreshed_ids = frozenset()
+        self.next_refresh = 0
+
+    def subscribe(self, session_id, coin_ids):
+        with self.lock:
+            self.subscribers[session_id] = (frozenset(coin_ids), time.time())
+
+    def watched_ids(self):
+        cutoff = time.time() - SUBSCRIBER_IDLE_TIMEOUT
+        with self.lock:
+            for session_id, (_, last_seen) in list(self.subscribers.items()):
+                if last_seen < cutoff:
+                    del self.subscribers[session_id]
+            return frozenset().union(*(ids for ids, _ in self.subscribers.values()))
+
+    def needs_refresh(self, coin_ids):
+        return time.time() >= self.next_refresh or not self.refreshed_ids.issuperset(coin_ids)
+
+    def refresh(self):
+        coin_ids = sorted(self.watched_ids())
+        data = {}
+        ok = True
+        for i in range(0, len(coin_ids), PRICE_BATCH_SIZE):
+            ids_str = ",".join(coin_ids[i:i + PRICE_BATCH_SIZE])
+            try:
+                response = coingecko_get(
+                    f"/simple/price?ids={ids_str}&vs_currencies=usd&include_24hr_change=true"
+                    "&include_last_updated_at=true",
+                    PRIORITY_ALERTS
+                )
+                if response.status_code == 200:
+                    data.update(response.json())
+                else:
+                    ok = False
+            except Exception as e:
+                get_metrics().count_failure("price_hub.refresh", e)
+                ok = False
+
+        with self.lock:
+            # Keep serving the last good prices for anything this round failed to fetch
+            snapshot = {c: self.snapshot[c] for c in coin_ids if c in self.snapshot}
+            snapshot.update(data)
+            self.snapshot = snapshot
+            # Feed each fresh quote to its coin's rolling windows, one O(1) tick per coin
+            now = time.time()
+            self.streams = {c: self.streams.get(c) or PriceStream() for c in coin_ids}
+            for coin_id, quote in data.items():
+                if coin_id in self.streams:
+                    self.streams[coin_id].push(quote.get("last_updated_at") or now, quote.get("usd"))
+            self.refreshed_ids = frozenset(coin_ids)
+            self.next_refresh = time.time() + (PRICE_REFRESH_INTERVAL if ok else PRICE_RETRY_INTERVAL)
+
+    def get_prices(self, session_id, coin_ids):
+        coin_ids = list(coin_ids)
+        self.subscribe(session_id, coin_ids)
+        if self.needs_refresh(coin_ids):
+            # Only wait on another session's refresh when we have nothing to show yet
+            with self.lock:
+                blocking = not any(c in self.snapshot for c in coin_ids)
+            if self.refresh_lock.acquire(blocking=blocking):
+                try:
+                    if self.needs_refresh(coin_ids):
+                        self.refresh()
+                finally:
+                    self.refresh_lock.release()
+        with self.lock:
+            return {c: self.snapshot[c] for c in coin_ids if c in self.snapshot}
+
+    def window_stats(self, coin_ids):
+        """Rolling-window readings per coin, for the alert rules"""
+        with self.lock:
+            return {c: self.streams[c].stats() for c in coin_ids if c in self.streams}
+
+@st.cache_resource
+def get_price_hub():
+    return PriceHub()
+
+@timed("fetch.watchlist_prices")
 def fetch_watchlist_prices():
     if not st.session_state.watchlist:
         return {}
+    return get_price_hub().get_prices(current_session_id(), st.session_state.watchlist.keys())
+
+# Local coin index
+COIN_INDEX_FILE = os.path.join(DATA_DIR, "coin_index.json")
+COIN_INDEX_MAX_AGE = 24 * 3600
+COIN_INDEX_RETRY_INTERVAL = 600
+COIN_INDEX_RANKED_PAGES = 4
+COIN_INDEX_PREFIX_SCAN = 500
+COIN_INDEX_FUZZY_CUTOFF = 0.8
+
+class CoinIndex:
+    """Searchable copy of the full /coins/list catalogue, ranked by market cap.
+
+    Lookups resolve exact id, symbol and name matches (ranked together by
+    market cap), then prefixes with dict and bisect lookups, and only fall back to difflib fuzzy matching over
+    the ranked coins. The catalogue is refreshed in a background thread and
+    persisted to COIN_INDEX_FILE so restarts start warm.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.updated_at = 0
+        self.next_attempt = 0
+        self._build([])
+        self.load()
+
+    def _build(self, coins):
+        coins = sorted(coins, key=lambda c: (c["market_cap_rank"] or float("inf"), c["id"]))
+        by_id, by_symbol, by_name = {}, {}, {}
+        for coin in coins:
+            by_id[coin["id"]] = coin
+            by_symbol.setdefault(coin["symbol"].lower(), []).append(coin)
+            by_name.setdefault(coin["name"].lower(), []).append(coin)
+        ranked = {}
+        for coin in coins:
+            if not coin["market_cap_rank"]:
+                break
+            ranked.setdefault(coin["symbol"].lower(), coin)
+            ranked.setdefault(coin["name"].lower(), coin)
+        # Swap in the new tables in one step so readers never see a half-built index
+        self.tables = (by_id, by_symbol, by_name, sorted(set(by_symbol) | set(by_name)), ranked)
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self._build([
+                {"id": i, "symbol": s, "name": n, "market_cap_rank": r}
+                for i, s, n, r in data["coins"]
+            ])
+            self.updated_at = data["updated_at"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self, coins):
+        data = {
+            "updated_at": self.updated_at,
+            "coins": [[c["id"], c["symbol"], c["name"], c["market_cap_rank"]] for c in coins],
+        }
+        try:
+            with file_lock(self.path):
+                atomic_write_json(self.path, data, separators=(",", ":"))
+        except OSError as e:
+            logger.warning("Could not write %s: %s", self.path, e)
+
+    def ensure_fresh(self):
+        """Kick off a background refresh when the catalogue is missing or stale"""
+        now = time.time()
+        with self.lock:
+            if (self.refreshing or now < self.next_attempt
+                    or now - self.updated_at < COIN_INDEX_MAX_AGE):
+                return
+            self.refreshing = True
+            self.next_attempt = now + COIN_INDEX_RETRY_INTERVAL
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        try:
+            response = coingecko_get("/coins/list", PRIORITY_BACKGROUND)
+            if response.status_code != 200:
+                return
+            catalogue = response.json()
+            ranks = self._fetch_ranks()
+            coins = [
+                {"id": c["id"], "symbol": c.get("symbol") or "", "name": c.get("name") or "", "market_cap_rank": ranks.get(c["id"])}
+                for c in catalogue
+            ]
+            self._build(coins)
+            self.updated_at = time.time()
+            self.save(coins)
+        except Exception as e:
+            get_metrics().count_failure("coin_index.refresh", e)
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def _fetch_ranks(self):
+        """market_cap_rank by id from the top market pages; a failed page keeps the ranks gathered so far"""
+        ranks = {}
+        try:
+            for page in range(1, COIN_INDEX_RANKED_PAGES + 1):
+                response = coingecko_get(
+                    f"/coins/markets?vs_currency=usd&order=market_cap_desc&per_page=250&page={page}&sparkline=false",
+                    PRIORITY_BACKGROUND
+                )
+                if response.status_code != 200:
+                    break
+                for market in response.json():
+                    ranks[market["id"]] = market.get("market_cap_rank")
+        except Exception as e:
+            get_metrics().count_failure("coin_index.ranks", e)
+        return ranks
+
+    def search(self, query, limit=10):
+        """Coins matching query, best first, in the shape of /search results"""
+        query = query.lower().strip()
+        by_id, by_symbol, by_name, keys, ranked = self.tables
+        if not query or not keys:
+            return []
+
+        matches = [by_id[query]] if query in by_id else []
+        matches += by_symbol.get(query, []) + by_name.get(query, [])
+        matches.sort(key=lambda c: c["market_cap_rank"] or float("inf"))
+
+        if len(matches) < limit:
+            prefixed = []
+            start = bisect.bisect_left(keys, query)
+            for key in keys[start:start + COIN_INDEX_PREFIX_SCAN]:
+                if not key.startswith(query):
+                    break
+                prefixed += by_symbol.get(key, []) + by_name.get(key, [])
+            matches += sorted(prefixed, key=lambda c: c["market_cap_rank"] or float("inf"))
+
+        if not matches:
+            for key in difflib.get_close_matches(query, ranked, n=limit, cutoff=COIN_INDEX_FUZZY_CUTOFF):
+                matches.append(ranked[key])
+
+        results, seen = [], set()
+        for coin in matches:
+            if coin["id"] not in seen:
+                seen.add(coin["id"])
+                results.append(coin)
+        return results[:limit]
+
+@st.cache_resource
+def get_coin_index():
+    return CoinIndex(COIN_INDEX_FILE)
+
+@timed("fetch.lookup_coin")
+def lookup_coin(query):
+    """Resolve a search from the local index, falling back to remote /search on a miss"""
+    index = get_coin_index()
+    index.ensure_fresh()
+    coins = index.search(query)
+    if coins:
+        return {"coins": coins}
+    return search_coin(query)
+
+# Vibe cache
+VIBE_CACHE_FILE = os.path.join(DATA_DIR, "vibe_cache.sqlite3")
+
+# Personality used for alert popup vibes
+ALERT_PERSONALITY = "A Financial News Anchor"
+
+# Default personality in every language
+DEFAULT_PERSONALITIES = [
+    "Default (Just the facts)", "Por defecto (Solo los hechos)",
+    "Par défaut (Juste les faits)", "Standard (Nur die Fakten)",
+    "デフォルト（事実のみ）", "默认（仅事实）"
+]
 
-    if (st.session_state.prices_cache and
-        time.time() - st.session_state.prices_cache_time < 120):
-        return st.session_state.prices_cache
-
-    coin_ids = list(st.session_state.watchlist.keys())
-    ids_str = ",".join(coin_ids)
-
-    try:
-        response = requests.get(
-            f"https://api.coingecko.com/api/v3/simple/price?ids={ids_str}&vs_currencies=usd&include_24hr_change=true",
-            timeout=10
+def canonical_personality(personality):
+    if personality in DEFAULT_PERSONALITIES:
+        return "default"
+    return " ".join(personality.lower().split())
+
+class VibeCache:
+    """SQLite-backed vibe cache keyed on quantized market state.
+
+    Prices fall into relative buckets of price_bucket_pct percent and 24h
+    changes into change_bucket-point buckets, so small ticks reuse the same
+    vibe. Entries expire after ttl seconds and the least recently used ones
+    are evicted beyond max_entries. Hit and miss counts are persisted
+    alongside the entries for tuning the bucket widths.
+    """
+
+    def __init__(self, path, price_bucket_pct, change_bucket, ttl, max_entries):
+        self.price_bucket_pct = price_bucket_pct
+        self.change_bucket = change_bucket
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS vibes ("
+            "key TEXT PRIMARY KEY, message TEXT, rating INTEGER, created REAL, accessed REAL)"
         )
-        if response.status_code == 200:
-            data = response.json()
-            st.session_state.prices_cache = data
-            st.session_state.prices_cache_time = time.time()
-            return data
-    except:
-        pass
+        self.db.execute("CREATE INDEX IF NOT EXISTS vibes_accessed ON vibes (accessed)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS vibe_stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.execute("INSERT OR IGNORE INTO vibe_stats VALUES ('hits', 0), ('misses', 0)")
+
+    def key(self, coin_name, price, change_24h, personality, language):
+        price_bucket = math.floor(math.log(price) / math.log1p(self.price_bucket_pct / 100)) if price > 0 else 0
+        change_bucket = math.floor((change_24h or 0) / self.change_bucket)
+        return "|".join([
+            coin_name.lower(), canonical_personality(personality), language,
+            str(price_bucket), str(change_bucket)
+        ])
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT message, rating FROM vibes WHERE key = ? AND created > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row:
+                self.db.execute("UPDATE vibes SET accessed = ? WHERE key = ?", (now, key))
+            self.db.execute(
+                "UPDATE vibe_stats SET value = value + 1 WHERE name = ?", ("hits" if row else "misses",)
+            )
+        if row:
+            return {"success": True, "message": row[0], "rating": row[1]}
+        return None
+
+    def put(self, key, result):
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO vibes VALUES (?, ?, ?, ?, ?)",
+                (key, result["message"], result["rating"], now, now)
+            )
+            self.db.execute("DELETE FROM vibes WHERE created <= ?", (now - self.ttl,))
+            self.db.execute(
+                "DELETE FROM vibes WHERE key IN ("
+                "SELECT key FROM vibes ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
 
-    return st.session_state.prices_cache
+    def contains(self, key):
+        """Whether a fresh entry exists, without touching LRU order or hit counts"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT 1 FROM vibes WHERE key = ? AND created > ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return row is not None
+
+    def stats(self):
+        """Persisted hit and miss counts, live entries and the hit rate; exported as vibe_cache_* gauges"""
+        with self.lock:
+            counts = dict(self.db.execute("SELECT name, value FROM vibe_stats"))
+            counts["entries"] = self.db.execute("SELECT COUNT(*) FROM vibes").fetchone()[0]
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+        return counts
+
+@st.cache_resource
+def get_vibe_cache():
+    cache = VibeCache(
+        VIBE_CACHE_FILE,
+        price_bucket_pct=config_value("VIBE_PRICE_BUCKET_PCT", 1.0),
+        change_bucket=config_value("VIBE_CHANGE_BUCKET", 1.0),
+        ttl=config_value("VIBE_CACHE_TTL", 3600),
+        max_entries=config_value("VIBE_CACHE_MAX_ENTRIES", 5000)
+    )
+    get_metrics().add_collector("vibe_cache", cache.stats)
+    return cache
 
-@st.cache_data(ttl=180, show_spinner=False)
+@timed("vibe.get_vibe_check")
 def get_vibe_check(coin_name, price, change_24h, personality, _api_key, language):
+    cache = get_vibe_cache()
+    key = cache.key(coin_name, price, change_24h, personality, language)
+    result = cache.get(key)
+    get_metrics().count_cache("vibe_cache", "miss" if result is None else "hit")
+    if result is None:
+        result = request_vibe_check(coin_name, price, change_24h, personality, _api_key, language)
+        if result["success"]:
+            cache.put(key, result)
+    return result
+
+def vibe_instructions(personality, language):
     lang_instruction = ""
     if language != "en":
         lang_names = {"es": "Spanish", "fr": "French", "de": "German", "ja": "Japanese", "zh": "Chinese"}
         lang_instruction = f"\n\nIMPORTANT: Write your response in {lang_names.get(language, 'English')}."
 
     # Handle default personality differently (check all language versions)
-    default_personalities = [
-        "Default (Just the facts)", "Por defecto (Solo los hechos)",
-        "Par défaut (Juste les faits)", "Standard (Nur die Fakten)",
-        "デフォルト（事実のみ）", "默认（仅事实）"
-    ]
-    if personality in default_personalities:
+    if personality in DEFAULT_PERSONALITIES:
         style_instruction = "Give a straightforward, factual 2-sentence summary of the market sentiment."
     else:
         style_instruction = f"Give a 2-sentence summary of the vibe in the style of {personality}."
+    return style_instruction, lang_instruction
 
-    prompt = f"""The price of {coin_name} is ${price:,.2f} and it has moved {change_24h:.2f}% in 24 hours.
+def build_vibe_prompt(coin_name, price, change_24h, personality, language):
+    style_instruction, lang_instruction = vibe_instructions(personality, language)
+    return f"""The price of {coin_name} is ${price:,.2f} and it has moved {change_24h:.2f}% in 24 hours.
 
 Give me:
 1. A vibe rating from 1-10 (1 = doom, 10 = moon)
@@ -480,148 +2110,443 @@ Format exactly like:
 RATING: [number]
 VIBE: [your 2 sentences]{lang_instruction}"""
 
+def parse_vibe(content):
+    """Pull the RATING and VIBE lines out of a completion; None for whatever is missing"""
+    rating = None
+    vibe = None
+    for line in content.strip().split("\n"):
+        if line.startswith("RATING:"):
+            try:
+                rating = int(line.replace("RATING:", "").strip().split()[0])
+            except:
+                pass
+        elif line.startswith("VIBE:"):
+            vibe = line.replace("VIBE:", "").strip()
+    return rating, vibe
+
+def groq_post(payload, _api_key, stream=False):
+    """POST a chat completion to Groq, counting the response status"""
     try:
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
+        response = get_http_session().post(
+            f"{GROQ_API}/chat/completions",
             headers={"Authorization": f"Bearer {_api_key}", "Content-Type": "application/json"},
-            json={"model": "llama-3.3-70b-versatile", "messages": [{"role": "user", "content": prompt}], "max_tokens": 300},
-            timeout=15
+            json=payload,
+            timeout=LLM_TIMEOUT,
+            stream=stream
+        )
+    except Exception:
+        get_metrics().count_upstream("groq", "/chat/completions", "error")
+        raise
+    get_metrics().count_upstream("groq", "/chat/completions", response.status_code)
+    return response
+
+def request_vibe_check(coin_name, price, change_24h, personality, _api_key, language):
+    prompt = build_vibe_prompt(coin_name, price, change_24h, personality, language)
+
+    try:
+        response = groq_post(
+            {"model": "llama-3.3-70b-versatile", "messages": [{"role": "user", "content": prompt}], "max_tokens": 300},
+            _api_key
         )
 
         if response.status_code == 200:
             content = response.json()["choices"][0]["message"]["content"]
-            rating = 5
-            vibe = content
-            for line in content.strip().split("\n"):
-                if line.startswith("RATING:"):
-                    try:
-                        rating = int(line.replace("RATING:", "").strip().split()[0])
-                    except:
-                        pass
-                elif line.startswith("VIBE:"):
-                    vibe = line.replace("VIBE:", "").strip()
-            return {"success": True, "message": vibe, "rating": rating}
+            rating, vibe = parse_vibe(content)
+            return {"success": True, "message": vibe or content, "rating": rating or 5}
         return {"success": False, "message": f"Error {response.status_code}", "rating": 0}
     except:
         return {"success": False, "message": "Connection error", "rating": 0}
 
-def get_rating_emoji(rating):
-    return {1: "💀", 2: "😱", 3: "😰", 4: "😟", 5: "😐", 6: "🙂", 7: "😊", 8: "😄", 9: "🚀", 10: "🌙"}.get(rating, "😐")
-
-# Page config - must be first Streamlit command
-st.set_page_config(
-    page_title="Crypto Vibe Check",
-    page_icon="🪙",
-    initial_sidebar_state="collapsed",
-    layout="wide"
-)
+@timed("vibe.stream_vibe_check")
+def stream_vibe_check(coin_name, price, change_24h, personality, _api_key, language):
+    """Yield progressively more complete vibe results from the SSE stream.
+
+    Partial results carry rating None until the RATING line is complete. The
+    last result yielded is final and goes into the same cache as get_vibe_check.
+    A stream the caller closes early (a rerun) is counted and not cached, as
+    its vibe is cut short.
+    """
+    cache = get_vibe_cache()
+    key = cache.key(coin_name, price, change_24h, personality, language)
+    cached = cache.get(key)
+    get_metrics().count_cache("vibe_cache", "miss" if cached is None else "hit")
+    if cached is not None:
+        yield cached
+        return
+
+    prompt = build_vibe_prompt(coin_name, price, change_24h, personality, language)
+    content = ""
+    error = None
+    try:
+        with groq_post(
+            {
+                "model": "llama-3.3-70b-versatile",
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 300,
+                "stream": True
+            },
+            _api_key,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                yield {"success": False, "message": f"Error {response.status_code}", "rating": 0}
+                return
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                content += delta
+                # Only trust RATING once its line is finished ("1" may still become "10")
+                rating, _ = parse_vibe(content[:content.rfind("\n") + 1])
+                _, vibe = parse_vibe(content)
+                yield {"success": True, "message": vibe or "", "rating": rating}
+    except GeneratorExit as e:
+        get_metrics().count_failure("vibe.stream_vibe_check", e)
+        raise
+    except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+        error = e
+    # Report failures outside the handlers, which may run while the generator is closing
+    if error is not None:
+        get_metrics().count_failure("vibe.stream_vibe_check", error)
+        yield {"success": False, "message": "Connection error", "rating": 0}
+        return
+
+    rating, vibe = parse_vibe(content)
+    result = {"success": True, "message": vibe or content, "rating": rating or 5}
+    cache.put(key, result)
+    yield result
+
+@timed("vibe.request_vibe_batch")
+def request_vibe_batch(coins, personality, _api_key, language):
+    """Vibes for several coins from one JSON-mode completion.
+
+    coins is a list of {"id", "name", "price", "change"} dicts. Every vibe
+    parsed from the reply is stored in the vibe cache under the same key a
+    single get_vibe_check would use; returns {coin_id: result}.
+    """
+    style_instruction, lang_instruction = vibe_instructions(personality, language)
+    market = [
+        {"id": c["id"], "name": c["name"], "price_usd": round(c["price"], 8), "change_24h_pct": round(c["change"], 2)}
+        for c in coins
+    ]
+    prompt = f"""Here is the current market state of several coins as JSON:
+{json.dumps(market)}
 
-# Mobile viewport meta tag
-st.markdown("""
-<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
-""", unsafe_allow_html=True)
+For every coin give:
+1. A vibe rating from 1-10 (1 = doom, 10 = moon)
+2. {style_instruction}
 
-# Check if language is set - show language selector first
-if st.session_state.language is None:
-    st.markdown("""
-    <style>
-    .stApp {
-        background: linear-gradient(135deg, #0a0a0f 0%, #1a0a2e 50%, #0f1a2e 100%);
-    }
-    * {
-        -webkit-user-select: none !important;
-        -moz-user-select: none !important;
-        -ms-user-select: none !important;
-        user-select: none !important;
-    }
-    .language-card {
-        background: linear-gradient(145deg, #1a1a2e, #252540);
-        border: 2px solid #3d3d6d;
-        border-radius: 20px;
-        padding: 40px;
-        text-align: center;
-        max-width: 500px;
-        margin: 100px auto;
-        box-shadow: 0 20px 60px rgba(0, 255, 255, 0.1), 0 0 40px rgba(255, 0, 255, 0.1);
-    }
-    .language-title {
-        font-size: 28px;
-        font-weight: 700;
-        background: linear-gradient(90deg, #00ffff, #ff00ff, #00ffff);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        margin-bottom: 10px;
-    }
-    .language-subtitle {
-        color: #8080a0;
-        font-size: 16px;
-        margin-bottom: 30px;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+Reply with JSON only, exactly like:
+{{"coins": [{{"id": "<coin id>", "rating": <number>, "vibe": "<your 2 sentences>"}}]}}{lang_instruction}"""
 
-    st.markdown("""
-    <div class="language-card">
-        <div class="language-title">Welcome! Select Your Language</div>
-        <div class="language-subtitle">Choose your preferred language to continue</div>
-    </div>
-    """, unsafe_allow_html=True)
+    try:
+        response = groq_post(
+            {
+                "model": "llama-3.3-70b-versatile",
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 100 + 150 * len(coins),
+                "response_format": {"type": "json_object"}
+            },
+            _api_key
+        )
+        if response.status_code != 200:
+            return {}
+        content = response.json()["choices"][0]["message"]["content"]
+        entries = json.loads(content).get("coins", [])
+    except Exception as e:
+        get_metrics().count_failure("vibe.request_vibe_batch", e)
+        return {}
 
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col2:
-        selected_lang = st.selectbox(
-            "Language",
-            options=list(LANGUAGE_OPTIONS.keys()),
-            format_func=lambda x: LANGUAGE_OPTIONS[x],
-            label_visibility="collapsed"
+    by_id = {c["id"]: c for c in coins}
+    cache = get_vibe_cache()
+    results = {}
+    for entry in entries:
+        coin = by_id.get(entry.get("id")) if isinstance(entry, dict) else None
+        if coin is None or not entry.get("vibe"):
+            continue
+        try:
+            rating = min(10, max(1, int(entry.get("rating"))))
+        except (TypeError, ValueError):
+            rating = 5
+        result = {"success": True, "message": str(entry["vibe"]).strip(), "rating": rating}
+        cache.put(cache.key(coin["name"], coin["price"], coin["change"], personality, language), result)
+        results[coin["id"]] = result
+    return results
+
+def prefetch_alert_vibes(alerts, api_key, language):
+    """Fill the vibe cache for every queued alert popup with one batched request"""
+    cache = get_vibe_cache()
+    missing = [
+        {"id": a["coin_id"], "name": a["name"], "price": a["price"], "change": a["change"]}
+        for a in alerts
+        if not cache.contains(cache.key(a["name"], a["price"], a["change"], ALERT_PERSONALITY, language))
+    ]
+    if len(missing) > 1:
+        request_vibe_batch(missing, ALERT_PERSONALITY, api_key, language)
+
+def vibe_results(coin_name, price, change_24h, personality, api_key, language):
+    """Results to render for a vibe: a live stream when VIBE_STREAMING is on, else one final result"""
+    if config_value("VIBE_STREAMING", True):
+        return stream_vibe_check(coin_name, price, change_24h, personality, api_key, language)
+    with st.spinner(t("getting_vibe")):
+        return [get_vibe_check(coin_name, price, change_24h, personality, api_key, language)]
+
+# Concurrent fetch layer
+FETCH_WORKERS = 16
+
+@st.cache_resource
+def get_fetch_executor():
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+def fetch_concurrently(calls):
+    """Run independent fetches at once; returns {name: result} after the slowest finishes.
+
+    calls maps a name to a (fn, *args) tuple. Workers are attached to the
+    current script run, so cached functions and session_state behave exactly
+    as they would inline. A call that raises yields None.
+    """
+    ctx = get_script_run_ctx()
+
+    def run(fn, args):
+        if ctx:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    executor = get_fetch_executor()
+    futures = {name: executor.submit(run, call[0], call[1:]) for name, call in calls.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception:
+            results[name] = None
+    return results
+
+def resolve_search(query):
+    """Search then price lookup for a query, run as one dependent chain"""
+    search_data = lookup_coin(query)
+    if search_data.get("coins"):
+        get_price(search_data["coins"][0]["id"])
+    return search_data
+
+# Background alert worker
+ALERT_POLL_INTERVAL = 120
+ALERT_EVENT_RETENTION = 7 * 24 * 3600
+ALERT_WORKER_SESSION = "alert-worker"
+
+class AlertWorker:
+    """Daemon thread that checks every user's thresholds on a schedule.
+
+    It subscribes all watched coins to the shared price hub, so its polls
+    are the same batched refresh the sessions read from, and writes breach
+    events to the alert log. Alerts fire whether or not anyone has the page
+    open; the UI only reads the pending events back.
+    """
+
+    def __init__(self, store, hub):
+        self.store = store
+        self.hub = hub
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="alert-worker", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.evaluate()
+            except Exception:
+                logger.exception("Alert evaluation failed")
+            self.wakeup.wait(ALERT_POLL_INTERVAL)
+            self.wakeup.clear()
+
+    def evaluate(self):
+        rows = self.store.watch_rows()
+        if not rows:
+            return
+        coin_ids = sorted({row[1] for row in rows})
+        prices = self.hub.get_prices(ALERT_WORKER_SESSION, coin_ids)
+        stats = self.hub.window_stats(coin_ids)
+        quotes = [prices.get(row[1]) for row in rows]
+        rules = [row[5] or "24h" for row in rows]
+        thresholds = np.fromiter((row[4] for row in rows), dtype=np.float64, count=len(rows))
+        values = rule_values(rules, quotes, [stats.get(row[1]) for row in rows])
+        breached = rule_breaches(rules, thresholds, [row[6] for row in rows], values)
+
+        breaches = [
+            rows[i][:5] + (rules[i], rows[i][6], quotes[i].get("usd_24h_change") or 0.0,
+                           float(values[i]), quotes[i].get("usd") or 0.0)
+            for i in np.flatnonzero(breached)
+        ]
+        # Coins whose fetch failed keep their current state until the next poll
+        cleared = [rows[i][:2] for i in np.flatnonzero(~breached) if quotes[i] is not None]
+        self.store.record_alerts(breaches, cleared)
+
+    def wake(self):
+        """Re-evaluate now instead of at the next poll, e.g. after a watchlist edit"""
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+@st.cache_resource
+def start_alert_worker():
+    return AlertWorker(get_user_store(), get_price_hub())
+
+def dismiss_popup(alert):
+    get_user_store().dismiss_alert(current_user_id(), alert["event_id"])
+
+# Alert evaluation
+class AlertEvaluation:
+    """Threshold breaches for a whole watchlist, evaluated once per rerun.
+
+    The watchlist and its prices are laid out as columns and compared in one
+    vectorized pass; the sidebar and the warning banners both read from the
+    same result. Popups come from the alert worker's event log instead.
+    """
+
+    def __init__(self, watchlist, prices, stats):
+        self.coin_ids = list(watchlist)
+        n = len(self.coin_ids)
+        quotes = [prices.get(coin_id) or {} for coin_id in self.coin_ids]
+        self.rules = [info.get("rule") or "24h" for info in watchlist.values()]
+        self.thresholds = np.fromiter((info["threshold"] for info in watchlist.values()), dtype=np.float64, count=n)
+        self.changes = np.fromiter((q.get("usd_24h_change") or 0.0 for q in quotes), dtype=np.float64, count=n)
+        self.prices = np.fromiter((q.get("usd") or 0.0 for q in quotes), dtype=np.float64, count=n)
+        self.values = rule_values(self.rules, quotes, [stats.get(coin_id) for coin_id in self.coin_ids])
+        self.directions = np.sign(self.changes).astype(np.int8)
+        self.breached = rule_breaches(
+            self.rules, self.thresholds, [info.get("level") for info in watchlist.values()], self.values
         )
+        self.index = {coin_id: i for i, coin_id in enumerate(self.coin_ids)}
+        self.alerting = [self.coin_ids[i] for i in np.flatnonzero(self.breached)]
+
+    def change(self, coin_id):
+        """24h percent change"""
+        i = self.index.get(coin_id)
+        return float(self.changes[i]) if i is not None else 0.0
+
+    def direction(self, coin_id):
+        """Sign of the 24h change, which sets the up/down arrow and colour whatever the rule"""
+        i = self.index.get(coin_id)
+        return int(self.directions[i]) if i is not None else 0
+
+    def reading(self, coin_id):
+        """The coin's rule reading formatted for display, e.g. +3.20% or z -2.75"""
+        i = self.index.get(coin_id)
+        if i is None:
+            return format_rule_value("24h", None)
+        return format_rule_value(self.rules[i], float(self.values[i]))
+
+    def is_breached(self, coin_id):
+        i = self.index.get(coin_id)
+        return bool(self.breached[i]) if i is not None else False
 
-        if st.button("Continue →"):
-            st.session_state.language = selected_lang
-            st.session_state.settings["language"] = selected_lang
-            save_settings(st.session_state.settings)
-            st.rerun()
+def get_rating_emoji(rating):
+    return {1: "💀", 2: "😱", 3: "😰", 4: "😟", 5: "😐", 6: "🙂", 7: "😊", 8: "😄", 9: "🚀", 10: "🌙"}.get(rating, "😐")
 
-    st.stop()
+def get_vibe_color(rating):
+    if rating is None:
+        return "#00ffff"
+    if rating <= 3:
+        return "#ff0066"
+    if rating <= 6:
+        return "#ffff00"
+    return "#00ff88"
+
+def vibe_card_html(rating, message):
+    """Main vibe card; rating None renders the pending state while a stream is still arriving"""
+    if rating is None:
+        vibe_glow = "rgba(0, 255, 255, 0.3)"
+        vibe_bg = "linear-gradient(135deg, #0a1a2d 0%, #1a0a2e 100%)"
+    elif rating <= 3:
+        vibe_glow = "rgba(255, 0, 102, 0.3)"
+        vibe_bg = "linear-gradient(135deg, #2d0a1a 0%, #1a0a2e 100%)"
+    elif rating <= 6:
+        vibe_glow = "rgba(255, 255, 0, 0.3)"
+        vibe_bg = "linear-gradient(135deg, #2d2d0a 0%, #1a0a2e 100%)"
+    else:
+        vibe_glow = "rgba(0, 255, 136, 0.3)"
+        vibe_bg = "linear-gradient(135deg, #0a2d1a 0%, #1a0a2e 100%)"
+    vibe_color = get_vibe_color(rating)
+    emoji = get_rating_emoji(rating) if rating is not None else "⏳"
+    rating_text = rating if rating is not None else "?"
 
-# Fetch watchlist prices
-watched_prices = fetch_watchlist_prices()
-
-# Check for alerts and prepare popups on first load
-if st.session_state.first_load:
-    for coin_id, coin_info in st.session_state.watchlist.items():
-        if coin_id in watched_prices:
-            change = watched_prices[coin_id].get("usd_24h_change", 0)
-            if change and abs(change) >= coin_info['threshold']:
-                if coin_id not in st.session_state.dismissed_popups:
-                    st.session_state.popup_alerts.append({
-                        "coin_id": coin_id,
-                        "name": coin_info["name"],
-                        "symbol": coin_info["symbol"],
-                        "change": change,
-                        "threshold": coin_info["threshold"],
-                        "price": watched_prices[coin_id].get("usd", 0)
-                    })
-    st.session_state.first_load = False
-
-# Check for alerts
-has_alerts = False
-alerting_coins = []
-for coin_id, coin_info in st.session_state.watchlist.items():
-    if coin_id in watched_prices:
-        change = watched_prices[coin_id].get("usd_24h_change", 0)
-        if change and abs(change) >= coin_info['threshold']:
-            alerting_coins.append(coin_id)
-            if coin_id not in st.session_state.acknowledged_alerts:
-                has_alerts = True
-
-if has_alerts:
-    st.session_state.acknowledged_alerts.update(alerting_coins)
-st.session_state.acknowledged_alerts &= set(alerting_coins)
+    return f"""
+    <div style="
+        background: {vibe_bg};
+        border: 1px solid {vibe_color};
+        border-radius: 16px;
+        padding: 24px;
+        margin: 10px 0;
+        box-shadow: 0 0 30px {vibe_glow};
+    ">
+        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 16px;">
+            <span style="color: #00ffff; font-size: 20px; font-weight: 600; text-shadow: 0 0 10px rgba(0, 255, 255, 0.5);">{t("the_vibe")}</span>
+            <div style="
+                background: rgba(10, 10, 20, 0.8);
+                border: 1px solid {vibe_color};
+                border-radius: 12px;
+                padding: 8px 16px;
+                display: flex;
+                align-items: center;
+                gap: 8px;
+                box-shadow: 0 0 15px {vibe_glow};
+            ">
+                <span style="font-size: 28px;">{emoji}</span>
+                <span style="color: {vibe_color}; font-size: 24px; font-weight: 700; text-shadow: 0 0 10px {vibe_glow};">{rating_text}/10</span>
+            </div>
+        </div>
+        <p style="color: #e0e0e0; font-size: 16px; line-height: 1.6; margin: 0;">{message}</p>
+    </div>
+    """
 
-# Cyberpunk Neon Theme CSS
-st.markdown("""
-<style>
+# Theme stylesheets
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+
+LANGUAGE_CSS = """
+.stApp {
+    background: linear-gradient(135deg, #0a0a0f 0%, #1a0a2e 50%, #0f1a2e 100%);
+}
+* {
+    -webkit-user-select: none !important;
+    -moz-user-select: none !important;
+    -ms-user-select: none !important;
+    user-select: none !important;
+}
+.language-card {
+    background: linear-gradient(145deg, #1a1a2e, #252540);
+    border: 2px solid #3d3d6d;
+    border-radius: 20px;
+    padding: 40px;
+    text-align: center;
+    max-width: 500px;
+    margin: 100px auto;
+    box-shadow: 0 20px 60px rgba(0, 255, 255, 0.1), 0 0 40px rgba(255, 0, 255, 0.1);
+}
+.language-title {
+    font-size: 28px;
+    font-weight: 700;
+    background: linear-gradient(90deg, #00ffff, #ff00ff, #00ffff);
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+    margin-bottom: 10px;
+}
+.language-subtitle {
+    color: #8080a0;
+    font-size: 16px;
+    margin-bottom: 30px;
+}
+"""
+
+THEME_CSS = """
 /* Global no-select */
 * {
     -webkit-user-select: none !important;
@@ -905,12 +2830,565 @@ a:hover {
         padding: 12px !important;
     }
 }
-</style>
+
+/* Floating coins on the home page */
+@keyframes float {
+    0%, 100% { transform: translateY(0) rotate(0deg); opacity: 0.6; }
+    50% { transform: translateY(-20px) rotate(10deg); opacity: 1; }
+}
+@keyframes floatSlow {
+    0%, 100% { transform: translateY(0) rotate(0deg); opacity: 0.4; }
+    50% { transform: translateY(-30px) rotate(-10deg); opacity: 0.8; }
+}
+@keyframes floatFast {
+    0%, 100% { transform: translateY(0) rotate(5deg); opacity: 0.5; }
+    50% { transform: translateY(-15px) rotate(-5deg); opacity: 0.9; }
+}
+.floating-coins {
+    position: fixed;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    pointer-events: none;
+    z-index: 0;
+    overflow: hidden;
+}
+.coin {
+    position: absolute;
+    font-size: 24px;
+    opacity: 0.5;
+}
+.coin:nth-child(1) { top: 15%; left: 10%; animation: float 4s ease-in-out infinite; }
+.coin:nth-child(2) { top: 25%; right: 15%; animation: floatSlow 5s ease-in-out infinite 0.5s; }
+.coin:nth-child(3) { top: 45%; left: 5%; animation: floatFast 3s ease-in-out infinite 1s; }
+.coin:nth-child(4) { top: 60%; right: 8%; animation: float 4.5s ease-in-out infinite 1.5s; }
+.coin:nth-child(5) { top: 75%; left: 12%; animation: floatSlow 5.5s ease-in-out infinite 0.3s; }
+.coin:nth-child(6) { top: 35%; right: 5%; animation: floatFast 3.5s ease-in-out infinite 0.8s; }
+.coin:nth-child(7) { top: 85%; right: 20%; animation: float 4s ease-in-out infinite 1.2s; }
+.coin:nth-child(8) { top: 10%; left: 25%; animation: floatSlow 6s ease-in-out infinite 0.7s; }
+.coin:nth-child(9) { top: 55%; left: 20%; animation: floatFast 3.2s ease-in-out infinite 1.8s; }
+.coin:nth-child(10) { top: 70%; right: 25%; animation: float 4.8s ease-in-out infinite 0.4s; }
+
+/* Prison bars over the search box while rate limited, switched on by the search_locked container key */
+.st-key-search_locked div[data-testid="stTextInput"] {
+    position: relative !important;
+}
+.st-key-search_locked div[data-testid="stTextInput"]::before {
+    content: "";
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    z-index: 9999;
+    cursor: not-allowed;
+}
+.st-key-search_locked div[data-testid="stTextInput"] > div:last-child::before {
+    content: "";
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    background:
+        repeating-linear-gradient(
+            90deg,
+            transparent 0px,
+            transparent 14px,
+            #0a0a15 14px,
+            #1a1a30 15px,
+            #2a2a45 16px,
+            #1a1a30 17px,
+            #0a0a15 18px,
+            transparent 18px
+        );
+    pointer-events: none;
+    z-index: 999;
+    border-radius: 12px;
+}
+.st-key-search_locked div[data-testid="stTextInput"] > div:last-child::after {
+    content: "";
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    background:
+        repeating-linear-gradient(
+            90deg,
+            transparent 0px,
+            transparent 14px,
+            rgba(0, 255, 255, 0.3) 15px,
+            rgba(255, 0, 255, 0.2) 16px,
+            rgba(0, 255, 255, 0.1) 17px,
+            transparent 18px
+        );
+    pointer-events: none;
+    z-index: 1000;
+    border-radius: 12px;
+}
+.st-key-search_locked div[data-testid="stTextInput"] input {
+    background: rgba(5, 5, 10, 0.9) !important;
+    cursor: not-allowed !important;
+    color: #1a1a30 !important;
+    border: 2px solid #1a0a2e !important;
+    box-shadow: inset 0 0 30px rgba(0,0,0,0.9) !important;
+}
+.st-key-search_locked button[disabled] {
+    opacity: 0.2 !important;
+    pointer-events: none !important;
+    filter: grayscale(100%) !important;
+}
+
+.rate-limit-notice {
+    background: linear-gradient(135deg, #2d0a3d 0%, #1a0a2e 100%);
+    border: 1px solid #ff00ff;
+    border-radius: 12px;
+    padding: 16px 20px;
+    margin: 10px 0;
+    display: flex;
+    align-items: center;
+    gap: 12px;
+    box-shadow: 0 0 20px rgba(255, 0, 255, 0.2);
+}
+.rate-limit-notice .icon {
+    font-size: 24px;
+}
+.rate-limit-notice .title {
+    color: #ff00ff;
+    font-weight: 600;
+    margin-bottom: 4px;
+}
+.rate-limit-notice .message {
+    color: #a0a0b0;
+    font-size: 14px;
+}
+
+/* Style the floating language popover */
+div[data-testid="stPopover"] > div:first-child > button {
+    position: fixed !important;
+    bottom: 20px !important;
+    left: 20px !important;
+    z-index: 9999 !important;
+    background: linear-gradient(135deg, rgba(0, 255, 255, 0.2) 0%, rgba(255, 0, 255, 0.2) 100%) !important;
+    border: 1px solid rgba(0, 255, 255, 0.5) !important;
+    border-radius: 20px !important;
+    padding: 10px 18px !important;
+    color: #00ffff !important;
+    font-size: 14px !important;
+    font-weight: 600 !important;
+    backdrop-filter: blur(10px) !important;
+    box-shadow: 0 4px 15px rgba(0, 0, 0, 0.3) !important;
+    min-height: 44px !important;
+}
+div[data-testid="stPopover"] > div:first-child > button:hover {
+    border-color: #ff00ff !important;
+    box-shadow: 0 4px 20px rgba(255, 0, 255, 0.3) !important;
+}
+/* Popover content styling */
+div[data-testid="stPopoverBody"] {
+    background: linear-gradient(135deg, rgba(10, 10, 20, 0.98) 0%, rgba(26, 10, 46, 0.98) 100%) !important;
+    border: 1px solid rgba(0, 255, 255, 0.5) !important;
+    border-radius: 16px !important;
+    backdrop-filter: blur(10px) !important;
+}
+div[data-testid="stPopoverBody"] button {
+    background: rgba(20, 20, 40, 0.8) !important;
+    border: 1px solid rgba(0, 255, 255, 0.3) !important;
+    border-radius: 10px !important;
+    color: #e0e0e0 !important;
+    padding: 12px 20px !important;
+    margin: 4px 0 !important;
+    width: 100% !important;
+    min-height: 48px !important;
+    font-size: 16px !important;
+    transition: all 0.2s ease !important;
+}
+div[data-testid="stPopoverBody"] button:hover {
+    background: rgba(0, 255, 255, 0.2) !important;
+    border-color: #00ffff !important;
+    color: #00ffff !important;
+}
+@media screen and (max-width: 768px) {
+    div[data-testid="stPopover"] > div:first-child > button {
+        bottom: 70px !important;
+        left: 10px !important;
+        padding: 12px 20px !important;
+        font-size: 16px !important;
+        min-height: 50px !important;
+    }
+    div[data-testid="stPopoverBody"] button {
+        padding: 14px 20px !important;
+        min-height: 52px !important;
+        font-size: 18px !important;
+    }
+}
+"""
+
+def minify_css(css):
+    """Drop comments and the whitespace CSS doesn't need"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+@st.cache_resource
+def theme_assets():
+    """Minify each stylesheet once per process and publish it under static/ when Streamlit serves it.
+
+    Returns {name: (href, css)}, href None when static serving is off. File
+    names carry a content hash, so browsers can cache a sheet indefinitely.
+    """
+    serve = st.get_option("server.enableStaticServing")
+    assets = {}
+    for name, css in (("language", LANGUAGE_CSS), ("theme", THEME_CSS)):
+        css = minify_css(css)
+        href = None
+        if serve:
+            filename = f"{name}-{hashlib.sha1(css.encode()).hexdigest()[:12]}.css"
+            path = os.path.join(STATIC_DIR, filename)
+            try:
+                if not os.path.exists(path):
+                    os.makedirs(STATIC_DIR, exist_ok=True)
+                    atomic_write_text(path, css)
+                href = f"app/static/{filename}"
+            except OSError as e:
+                logger.warning("Could not publish %s: %s", filename, e)
+        assets[name] = (href, css)
+    return assets
+
+@timed("render.css")
+def use_stylesheet(name):
+    """Link a theme sheet, a few dozen bytes per rerun, or inline it when static serving is off"""
+    href, css = theme_assets()[name]
+    if href:
+        st.markdown(f'<link rel="stylesheet" href="{href}">', unsafe_allow_html=True)
+    else:
+        st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+
+# Startup report
+HEAVY_MODULES = ("plotly", "pandas", "pyarrow", "matplotlib")
+
+@st.cache_resource
+def startup_reports():
+    """First-run timings of every session since the process started; entry 0 is the cold start"""
+    return []
+
+def finish_startup_report(screen):
+    """Record how this session's first run split between imports, bootstrap and first render"""
+    if "startup_report" in st.session_state:
+        return
+    reports = startup_reports()
+    now = time.perf_counter()
+    report = {
+        "screen": screen,
+        "cold": not reports,
+        "imports_ms": IMPORT_SECONDS * 1000,
+        "bootstrap_ms": (BOOTSTRAPPED - IMPORT_STARTED - IMPORT_SECONDS) * 1000,
+        "first_render_ms": (now - BOOTSTRAPPED) * 1000,
+        "total_ms": (now - IMPORT_STARTED) * 1000,
+        "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
+    reports.append(report)
+    st.session_state.startup_report = report
+    logger.info(
+        "Startup (%s, %s): imports %.0f ms, bootstrap %.0f ms, first render %.0f ms, heavy modules loaded: %s",
+        screen, "cold" if report["cold"] else "warm", report["imports_ms"], report["bootstrap_ms"],
+        report["first_render_ms"], ", ".join(report["heavy_modules"]) or "none"
+    )
+    if config_value("STARTUP_REPORT", False):
+        st.caption(
+            f"⏱️ {'Cold' if report['cold'] else 'Warm'} start: imports {report['imports_ms']:.0f} ms · "
+            f"bootstrap {report['bootstrap_ms']:.0f} ms · first render {report['first_render_ms']:.0f} ms · "
+            f"heavy modules: {', '.join(report['heavy_modules']) or 'none'}"
+        )
+
+# Profiler
+# ?profile=1, or the PROFILER secret for every session, profiles full script runs
+PROFILE_PARAM = "profile"
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_TOP_ALLOCATIONS = 15
+
+class AllocationTracer:
+    """Reference-counted tracemalloc, so overlapping profiled runs don't stop each other's tracing"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+    def acquire(self):
+        """Start tracing if needed and return the baseline snapshot"""
+        import tracemalloc
+
+        with self.lock:
+            if self.users == 0:
+                tracemalloc.start()
+            self.users += 1
+        return tracemalloc.take_snapshot()
+
+    def release(self, baseline=None):
+        """Allocation growth since baseline by source line, then stop tracing when unused"""
+        import tracemalloc
+
+        growth = tracemalloc.take_snapshot().compare_to(baseline, "lineno") if baseline else []
+        with self.lock:
+            self.users -= 1
+            if self.users == 0:
+                tracemalloc.stop()
+        return growth
+
+@st.cache_resource
+def get_allocation_tracer():
+    return AllocationTracer()
+
+class ProfilerSlot:
+    """The process's one cProfile, lent to a single run at a time.
+
+    Python 3.12+ refuses to enable a second profiler anywhere in the process,
+    so a run overlapping another profiled run (or another profiling tool)
+    gets spans and allocations only.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owner = None
+
+    def acquire(self, run):
+        """An enabled profiler for run on this thread, or None when the slot or interpreter is busy"""
+        import cProfile
+
+        with self.lock:
+            if self.owner is not None:
+                return None
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                return None
+            self.owner = run
+            return profiler
+
+    def release(self, run):
+        with self.lock:
+            if self.owner is run:
+                run["profiler"].disable()
+                self.owner = None
+
+@st.cache_resource
+def get_profiler_slot():
+    return ProfilerSlot()
+
+def close_profile_run(run, baseline=None):
+    """Stop everything a profiled run started, once; its (spans, allocation growth), or None if already closed"""
+    with run["lock"]:
+        if run["closed"]:
+            return None
+        run["closed"] = True
+    run["slot"].release(run)
+    spans = run["metrics"].stop_trace(run["session_id"])
+    return spans, run["tracer"].release(baseline)
+
+def reap_profile_run(script_thread, run):
+    """Close a run that never reached finish_profile (it raised or was stopped) once its thread exits"""
+    script_thread.join()
+    close_profile_run(run)
+
+def start_profile():
+    """Profile the rest of this run when asked to; a run cut short by st.rerun() is dropped first.
+
+    When profiling is off this costs a query parameter and a config lookup.
+    """
+    abandoned = st.session_state.pop("profile_run", None)
+    if abandoned:
+        close_profile_run(abandoned)
+    if st.query_params.get(PROFILE_PARAM) != "1" and not config_value("PROFILER", False):
+        return
+
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx else "bare"
+    run = {
+        "session_id": session_id,
+        "metrics": get_metrics(),
+        "tracer": get_allocation_tracer(),
+        "slot": get_profiler_slot(),
+        "lock": threading.Lock(),
+        "closed": False,
+        "started": time.perf_counter(),
+    }
+    run["metrics"].start_trace(session_id)
+    run["baseline"] = run["tracer"].acquire()
+    run["profiler"] = None
+    st.session_state.profile_run = run
+    threading.Thread(
+        target=reap_profile_run, args=(threading.current_thread(), run), name="profile-reaper", daemon=True
+    ).start()
+    run["profiler"] = run["slot"].acquire(run)
+
+def profile_function_name(func):
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+def finish_profile():
+    """Stop this run's profiler and show hot functions, span totals and allocations in an expander"""
+    run = st.session_state.pop("profile_run", None)
+    if run is None:
+        return
+    elapsed = time.perf_counter() - run["started"]
+    closed = close_profile_run(run, run["baseline"])
+    if closed is None:
+        return
+    spans, allocations = closed
+    profiler = run["profiler"]
+
+    import marshal
+
+    with st.expander(f"🔬 Profile of this run ({elapsed * 1000:.0f} ms)"):
+        if profiler is not None:
+            profiler.create_stats()
+            stats = profiler.stats
+            st.markdown("**Hot functions** (script thread, by own time)")
+            hot = sorted(stats.items(), key=lambda item: -item[1][2])[:PROFILE_TOP_FUNCTIONS]
+            st.dataframe([
+                {"function": profile_function_name(func), "calls": calls, "own ms": round(own * 1000, 2),
+                 "cumulative ms": round(cumulative * 1000, 2)}
+                for func, (_, calls, own, cumulative, _) in hot
+            ], hide_index=True)
+        else:
+            st.caption("Profiler busy: another run or tool holds the process's profiler, so this run "
+                       "has spans and allocations only.")
+
+        st.markdown("**Time per fetcher and phase** (all threads working for this session)")
+        totals = {}
+        for name, seconds in spans:
+            calls, total = totals.get(name, (0, 0.0))
+            totals[name] = (calls + 1, total + seconds)
+        st.dataframe([
+            {"span": name, "calls": calls, "total ms": round(total * 1000, 1)}
+            for name, (calls, total) in sorted(totals.items(), key=lambda item: -item[1][1])
+        ], hide_index=True)
+
+        st.markdown("**Allocations** (blocks still held since the run started, whole process)")
+        top = sorted(allocations, key=lambda stat: -stat.count_diff)[:PROFILE_TOP_ALLOCATIONS]
+        st.dataframe([
+            {"line": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+             "new blocks": stat.count_diff, "KiB": round(stat.size_diff / 1024, 1)}
+            for stat in top
+        ], hide_index=True)
+
+        if profiler is not None:
+            st.download_button(
+                "⬇️ Download profile (.prof)", marshal.dumps(stats),
+                file_name=f"vibe-check-{time.strftime('%Y%m%d-%H%M%S')}.prof",
+                mime="application/octet-stream", on_click="ignore"
+            )
+        st.caption("Open with `python -m pstats` or snakeviz. Fragment reruns and fetch-pool threads are not "
+                   "in the function profile; the span table covers their time.")
+
+BOOTSTRAPPED = time.perf_counter()
+
+# Page config - must be first Streamlit command
+st.set_page_config(
+    page_title="Crypto Vibe Check",
+    page_icon="🪙",
+    initial_sidebar_state="collapsed",
+    layout="wide"
+)
+start_metrics_exporter()
+start_profile()
+
+# Mobile viewport meta tag
+st.markdown("""
+<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
 """, unsafe_allow_html=True)
 
+# Check if language is set - show language selector first
+if st.session_state.language is None:
+    use_stylesheet("language")
+
+    st.markdown("""
+    <div class="language-card">
+        <div class="language-title">Welcome! Select Your Language</div>
+        <div class="language-subtitle">Choose your preferred language to continue</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        selected_lang = st.selectbox(
+            "Language",
+            options=list(LANGUAGE_OPTIONS.keys()),
+            format_func=lambda x: LANGUAGE_OPTIONS[x],
+            label_visibility="collapsed"
+        )
+
+        if st.button("Continue →"):
+            st.session_state.language = selected_lang
+            save_setting("language", selected_lang)
+            st.rerun()
+
+    finish_profile()
+    finish_startup_report("language")
+    st.stop()
+
+# Alerts are evaluated in the background; this session only reads its pending events
+start_alert_worker()
+popup_alerts = get_user_store().pending_alerts(current_user_id())
+
+# Start this rerun's independent upstream calls at once and wait for the slowest
+pending_symbol = st.session_state.get("selected_coin") or st.session_state.get("search_input")
+rerun_calls = {"watchlist": (fetch_watchlist_prices,)}
+if not popup_alerts and not is_rate_limited():
+    if pending_symbol:
+        rerun_calls["search"] = (resolve_search, pending_symbol.lower().strip())
+    else:
+        rerun_calls["trending"] = (get_trending_coins,)
+with span("fetch.fan_out"):
+    watched_prices = fetch_concurrently(rerun_calls)["watchlist"] or {}
+
+# Evaluate every watchlist alert once for this rerun
+with span("alerts.evaluate"):
+    alerts = AlertEvaluation(
+        st.session_state.watchlist, watched_prices, get_price_hub().window_stats(st.session_state.watchlist)
+    )
+alerting_coins = alerts.alerting
+
+# Cyberpunk Neon Theme CSS
+use_stylesheet("theme")
+
+def rerun_fragment():
+    """Rerun just the calling fragment; when it was drawn as part of a full run, rerun the app"""
+    ctx = get_script_run_ctx()
+    st.rerun(scope="fragment" if ctx and ctx.fragment_ids_this_run else "app")
+
+def current_alerts():
+    """This rerun's alert evaluation; a fragment rerunning on its own evaluates afresh"""
+    ctx = get_script_run_ctx()
+    if ctx and ctx.fragment_ids_this_run:
+        return AlertEvaluation(
+            st.session_state.watchlist, fetch_watchlist_prices() or {},
+            get_price_hub().window_stats(st.session_state.watchlist)
+        )
+    return alerts
+
 # Show alert popups
-if st.session_state.popup_alerts:
-    alert = st.session_state.popup_alerts[0]
+def next_popup(alert, pending):
+    """Dismiss alert and show the next queued one in place; the last one hands back to the full page"""
+    dismiss_popup(alert)
+    if len(pending) > 1:
+        rerun_fragment()
+    st.rerun()
+
+@st.fragment
+@timed("render.popup")
+def alert_popup():
+    """The oldest pending alert, rerun on its own while the queue is worked through"""
+    pending = get_user_store().pending_alerts(current_user_id())
+    if not pending:
+        st.rerun()
+    alert = pending[0]
     coin_id = alert["coin_id"]
 
     change_color = "#00ff88" if alert["change"] > 0 else "#ff0066"
@@ -925,9 +3403,7 @@ if st.session_state.popup_alerts:
         st.markdown(f"## 🚨 {t('alert_title')}")
     with col_close:
         if st.button("✕", key=f"dismiss_{coin_id}", help=t("dismiss")):
-            st.session_state.popup_alerts.pop(0)
-            st.session_state.dismissed_popups.add(coin_id)
-            st.rerun()
+            next_popup(alert, pending)
 
     # Coin name with CoinGecko link
     st.markdown(f"### {alert['name']} ({alert['symbol']})")
@@ -940,102 +3416,111 @@ if st.session_state.popup_alerts:
     col1, col2, col3 = st.columns(3)
     with col1:
         st.metric(
-            t("current_change"),
-            f"{change_symbol}{alert['change']:.2f}%",
+            t("current_change") if alert["rule"] == "24h" else t(f"rule_{alert['rule']}"),
+            format_rule_value(alert["rule"], alert["value"]),
             delta=f"{change_symbol}{alert['change']:.2f}%"
         )
     with col2:
-        st.metric(t("your_threshold"), f"±{alert['threshold']}%")
+        st.metric(t("your_threshold"), format_rule_target(alert["rule"], alert["threshold"], alert["level"]))
     with col3:
         st.metric(t("price_label"), f"${alert['price']:,.2f}")
 
-    # AI Vibe Summary
+    # Load the chart and, when several alerts fired together, all their vibes
+    # in one batched round trip per burst, side by side
     api_key = st.secrets.get("GROQ_API_KEY", "")
+    popup_calls = {"chart": (get_chart_series, coin_id)}
+    pending_ids = {a["event_id"] for a in pending}
+    if api_key and not pending_ids <= st.session_state.alert_vibes_prefetched:
+        popup_calls["vibes"] = (prefetch_alert_vibes, pending, api_key, st.session_state.language)
+        st.session_state.alert_vibes_prefetched = pending_ids
+    popup_data = fetch_concurrently(popup_calls)
+
+    # AI Vibe Summary
     if api_key:
         st.markdown(f"#### {t('the_vibe')}")
-        with st.spinner(t("getting_vibe")):
-            vibe_result = get_vibe_check(
-                alert['name'],
-                alert['price'],
-                alert['change'],
-                "A Financial News Anchor",
-                api_key,
-                st.session_state.language
-            )
-
-        if vibe_result["success"]:
-            rating = vibe_result['rating']
-            emoji = get_rating_emoji(rating)
-
-            if rating <= 3:
-                vibe_color = "#ff0066"
-            elif rating <= 6:
-                vibe_color = "#ffff00"
-            else:
-                vibe_color = "#00ff88"
-
-            col_emoji, col_msg = st.columns([1, 5])
-            with col_emoji:
-                st.markdown(f"<div style='font-size: 48px; text-align: center;'>{emoji}</div>", unsafe_allow_html=True)
-                st.markdown(f"<div style='text-align: center; color: {vibe_color}; font-weight: bold;'>{rating}/10</div>", unsafe_allow_html=True)
-            with col_msg:
-                st.info(vibe_result["message"])
+        col_emoji, col_msg = st.columns([1, 5])
+        emoji_slot = col_emoji.empty()
+        message_slot = col_msg.empty()
+        for vibe_result in vibe_results(
+            alert['name'],
+            alert['price'],
+            alert['change'],
+            ALERT_PERSONALITY,
+            api_key,
+            st.session_state.language
+        ):
+            if vibe_result["success"]:
+                rating = vibe_result['rating']
+                emoji = get_rating_emoji(rating) if rating is not None else "⏳"
+                rating_text = rating if rating is not None else "?"
+                emoji_slot.markdown(
+                    f"<div style='font-size: 48px; text-align: center;'>{emoji}</div>"
+                    f"<div style='text-align: center; color: {get_vibe_color(rating)}; font-weight: bold;'>{rating_text}/10</div>",
+                    unsafe_allow_html=True
+                )
+                message_slot.info(vibe_result["message"] or t("getting_vibe"))
 
     # Interactive Chart
     st.markdown(f"#### {t('price_history')}")
 
-    # Load data for chart (365 days for zoom out capability)
-    chart_data = get_coin_chart(coin_id, 365)
-    if chart_data:
-        df = pd.DataFrame(chart_data, columns=["Date", "Price"])
-
-        # Calculate initial range (last 7 days)
-        now = datetime.now()
-        seven_days_ago = now - timedelta(days=7)
-
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=df["Date"],
-            y=df["Price"],
-            mode='lines',
-            name='Price',
-            line=dict(color='#00ffff', width=2),
-            fill='tozeroy',
-            fillcolor='rgba(0, 255, 255, 0.1)'
-        ))
-
-        fig.update_layout(
-            plot_bgcolor='#0a0a14',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color='#ffffff',
-            xaxis=dict(
-                gridcolor='#1a1a2e',
-                range=[seven_days_ago, now],
-                rangeslider=dict(visible=True, thickness=0.1),
-                rangeselector=dict(
-                    buttons=[
-                        dict(count=7, label="7D", step="day", stepmode="backward"),
-                        dict(count=30, label="30D", step="day", stepmode="backward"),
-                        dict(count=90, label="90D", step="day", stepmode="backward"),
-                        dict(count=1, label="1Y", step="year", stepmode="backward"),
-                        dict(step="all", label="ALL")
-                    ],
-                    bgcolor='#1a1a2e',
-                    activecolor='#ff00ff',
-                    font=dict(color='#fff', size=11),
-                    x=0,
-                    y=1.15
-                )
-            ),
-            yaxis=dict(gridcolor='#1a1a2e', tickprefix='$'),
-            margin=dict(l=50, r=20, t=60, b=20),
-            height=350,
-            hovermode='x unified'
-        )
+    with span("render.popup_chart"):
+        # Multi-resolution year of data for zoom out capability
+        chart_ts, chart_prices = popup_data["chart"] or chart_columns([])
+        if len(chart_ts):
+            # Calculate initial range (last 7 days) in epoch-ms, like the data
+            now = time.time() * 1000
+            seven_days_ago = now - 7 * 86400 * 1000
+
+            import plotly.graph_objects as go
+
+            # Float64 epoch-ms on a date axis goes to the browser as a typed array
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=chart_ts.astype(np.float64),
+                y=chart_prices,
+                mode='lines',
+                name='Price',
+                line=dict(color='#00ffff', width=2),
+                fill='tozeroy',
+                fillcolor='rgba(0, 255, 255, 0.1)'
+            ))
+
+            fig.update_layout(
+                plot_bgcolor='#0a0a14',
+                paper_bgcolor='rgba(0,0,0,0)',
+                font_color='#ffffff',
+                xaxis=dict(
+                    type='date',
+                    gridcolor='#1a1a2e',
+                    range=[seven_days_ago, now],
+                    rangeslider=dict(visible=True, thickness=0.1),
+                    rangeselector=dict(
+                        buttons=[
+                            dict(count=7, label="7D", step="day", stepmode="backward"),
+                            dict(count=30, label="30D", step="day", stepmode="backward"),
+                            dict(count=90, label="90D", step="day", stepmode="backward"),
+                            dict(count=1, label="1Y", step="year", stepmode="backward"),
+                            dict(step="all", label="ALL")
+                        ],
+                        bgcolor='#1a1a2e',
+                        activecolor='#ff00ff',
+                        font=dict(color='#fff', size=11),
+                        x=0,
+                        y=1.15
+                    )
+                ),
+                yaxis=dict(gridcolor='#1a1a2e', tickprefix='$'),
+                margin=dict(l=50, r=20, t=60, b=20),
+                height=350,
+                hovermode='x unified'
+            )
 
-        st.plotly_chart(fig, key=f"popup_chart_{coin_id}")
-    else:
-        st.info("📊 Chart data unavailable")
+            st.plotly_chart(fig, key=f"popup_chart_{coin_id}")
+            # The history store keeps the chart current; an old last point means its syncs are failing
+            chart_age = time.time() - chart_ts[-1] / 1000
+            stale_caption(chart_age if chart_age > CHART_STALE_AFTER else 0)
+        else:
+            st.info("📊 Chart data unavailable")
 
     # Quick Actions
     st.markdown("#### Quick Actions")
@@ -1044,25 +3529,25 @@ if st.session_state.popup_alerts:
     with col_search:
         if st.button("🔍 Search This Coin", key=f"search_{coin_id}"):
             st.session_state.selected_coin = coin_id
-            st.session_state.popup_alerts.pop(0)
-            st.session_state.dismissed_popups.add(coin_id)
+            dismiss_popup(alert)
             st.rerun()
 
     with col_remove:
         if st.button("🗑️ Remove from Watchlist", key=f"remove_{coin_id}"):
-            if coin_id in st.session_state.watchlist:
-                del st.session_state.watchlist[coin_id]
-                save_watchlist(st.session_state.watchlist)
-            st.session_state.popup_alerts.pop(0)
-            st.session_state.dismissed_popups.add(coin_id)
+            remove_from_watchlist(coin_id)
+            dismiss_popup(alert)
             st.rerun()
 
     with col_dismiss:
         if st.button(f"✕ {t('dismiss')}", key=f"dismiss_bottom_{coin_id}"):
-            st.session_state.popup_alerts.pop(0)
-            st.session_state.dismissed_popups.add(coin_id)
-            st.rerun()
+            next_popup(alert, pending)
+
 
+if popup_alerts:
+    alert_popup()
+    get_metrics().observe("rerun", time.perf_counter() - IMPORT_STARTED)
+    finish_profile()
+    finish_startup_report("alert")
     st.stop()
 
 st.title(f"✨ {t('title')}")
@@ -1070,67 +3555,106 @@ st.title(f"✨ {t('title')}")
 api_key = st.secrets.get("GROQ_API_KEY", "")
 
 # === SIDEBAR ===
-st.sidebar.header(t("price_alerts"))
+@st.fragment
+@timed("render.sidebar")
+def watchlist_panel():
+    """Sidebar watchlist; sliders and the edit buttons rerun only this panel"""
+    st.header(t("price_alerts"))
+    if not st.session_state.watchlist:
+        st.info(t("no_watchlist"))
+        return
+
+    st.subheader(t("your_watchlist"))
+    alerts = current_alerts()
 
-if st.session_state.watchlist:
-    st.sidebar.subheader(t("your_watchlist"))
+    # Check for unacknowledged alerts
+    has_alerts = any(coin_id not in st.session_state.acknowledged_alerts for coin_id in alerts.alerting)
+    if has_alerts:
+        st.session_state.acknowledged_alerts.update(alerts.alerting)
+    st.session_state.acknowledged_alerts &= set(alerts.alerting)
 
     for coin_id, coin_info in list(st.session_state.watchlist.items()):
-        change = watched_prices.get(coin_id, {}).get("usd_24h_change", 0) or 0
-        is_alerting = abs(change) >= coin_info['threshold'] if change else False
+        direction = alerts.direction(coin_id)
+        is_alerting = alerts.is_breached(coin_id)
         is_acknowledged = coin_id in st.session_state.acknowledged_alerts
 
-        col1, col2, col3 = st.sidebar.columns([3, 1, 1])
+        col1, col2, col3 = st.columns([3, 1, 1])
 
         with col1:
             if is_alerting and not is_acknowledged:
-                color = "🟢" if change > 0 else "🔴"
-                st.error(f"{color} **{coin_info['symbol']}**: {change:+.2f}%")
+                color = "🟢" if direction > 0 else "🔴"
+                st.error(f"{color} **{coin_info['symbol']}**: {alerts.reading(coin_id)}")
             elif is_alerting or st.session_state.editing_threshold == coin_id:
-                new_threshold = st.slider(
-                    coin_info['symbol'], 1, 50, coin_info['threshold'],
-                    key=f"thresh_{coin_id}"
+                rule = coin_info.get("rule") or "24h"
+                new_rule = st.selectbox(
+                    t("alert_rule"), ALERT_RULES, index=ALERT_RULES.index(rule),
+                    format_func=lambda r: t(f"rule_{r}"), key=f"rule_{coin_id}"
                 )
-                if new_threshold != coin_info['threshold']:
-                    st.session_state.watchlist[coin_id]['threshold'] = new_threshold
-                    save_watchlist(st.session_state.watchlist)
+                if new_rule != rule:
+                    threshold = min(coin_info['threshold'], RULE_SLIDER_MAX.get(new_rule, 50))
+                    # Start a new price-cross level 5% away, so picking the rule doesn't fire it at once
+                    level = coin_info.get("level")
+                    if new_rule in LEVEL_RULES and not level:
+                        price = float(alerts.prices[alerts.index[coin_id]])
+                        level = float(f"{price * (1.05 if new_rule == 'above' else 0.95):.4g}") or None
+                    set_alert_rule(coin_id, new_rule, threshold, level if new_rule in LEVEL_RULES else None)
+                    # Keep the editor open; the coin may stop alerting under the new rule
+                    st.session_state.editing_threshold = coin_id
+                    rerun_fragment()
+                if rule in LEVEL_RULES:
+                    new_level = st.number_input(
+                        t("alert_level"), min_value=0.0, value=float(coin_info.get("level") or 0.0),
+                        format="%.6g", key=f"level_{coin_id}"
+                    )
+                    if new_level != (coin_info.get("level") or 0.0):
+                        set_alert_rule(coin_id, rule, coin_info['threshold'], new_level or None)
+                else:
+                    new_threshold = st.slider(
+                        coin_info['symbol'], 1, RULE_SLIDER_MAX.get(rule, 50), coin_info['threshold'],
+                        key=f"thresh_{coin_id}"
+                    )
+                    if new_threshold != coin_info['threshold']:
+                        set_alert_threshold(coin_id, new_threshold)
             else:
-                color = "🟢" if change > 0 else "🔴" if change < 0 else "⚪"
-                st.info(f"{color} **{coin_info['symbol']}**: {change:+.2f}%")
+                color = "🟢" if direction > 0 else "🔴" if direction < 0 else "⚪"
+                st.info(f"{color} **{coin_info['symbol']}**: {alerts.reading(coin_id)}")
 
         with col2:
             if is_alerting and not is_acknowledged:
                 if st.button("✏️", key=f"ack_{coin_id}"):
                     st.session_state.acknowledged_alerts.add(coin_id)
-                    st.rerun()
+                    rerun_fragment()
             elif is_alerting:
                 if st.button("✓", key=f"done_{coin_id}"):
                     st.session_state.acknowledged_alerts.discard(coin_id)
-                    st.rerun()
+                    rerun_fragment()
             elif st.session_state.editing_threshold == coin_id:
                 if st.button("✓", key=f"save_{coin_id}"):
                     st.session_state.editing_threshold = None
-                    st.rerun()
+                    rerun_fragment()
             else:
                 if st.button("⚙️", key=f"edit_{coin_id}"):
                     st.session_state.editing_threshold = coin_id
-                    st.rerun()
+                    rerun_fragment()
 
         with col3:
             if st.button("❌", key=f"del_{coin_id}"):
-                del st.session_state.watchlist[coin_id]
-                save_watchlist(st.session_state.watchlist)
+                remove_from_watchlist(coin_id)
+                # Removing a coin changes the search result's watch button and the banners too
                 st.rerun()
 
+with st.sidebar:
+    watchlist_panel()
+
+with span("render.alert_banners"):
     for coin_id in alerting_coins:
         if coin_id in st.session_state.watchlist:
             info = st.session_state.watchlist[coin_id]
-            change = watched_prices.get(coin_id, {}).get("usd_24h_change", 0)
-            if change:
-                direction = t("up") if change > 0 else t("down")
-                st.warning(f"🚨 **{info['name']}** {direction} {abs(change):.2f}%!")
-else:
-    st.sidebar.info(t("no_watchlist"))
+            if (info.get("rule") or "24h") == "24h":
+                direction = t("up") if alerts.direction(coin_id) > 0 else t("down")
+                st.warning(f"🚨 **{info['name']}** {direction} {abs(alerts.change(coin_id)):.2f}%!")
+            else:
+                st.warning(f"🚨 **{info['name']}** {t('rule_' + info['rule'])}: {alerts.reading(coin_id)}!")
 
 st.sidebar.divider()
 
@@ -1147,8 +3671,7 @@ new_lang = st.sidebar.selectbox(
 )
 if new_lang != st.session_state.language:
     st.session_state.language = new_lang
-    st.session_state.settings["language"] = new_lang
-    save_settings(st.session_state.settings)
+    save_setting("language", new_lang)
     st.rerun()
 
 st.sidebar.divider()
@@ -1214,388 +3737,168 @@ CUSTOM_INPUT_LABELS = {
     "zh": "输入您的自定义个性:"
 }
 
-lang = st.session_state.language
-preset_personalities = PERSONALITIES.get(lang, PERSONALITIES["en"])
-custom_option = preset_personalities[-1]  # Last item is always custom
-
-selected_personality = st.selectbox(t("personality_label"), preset_personalities)
-
-if selected_personality == custom_option:
-    personality = st.text_input(
-        CUSTOM_INPUT_LABELS.get(lang, CUSTOM_INPUT_LABELS["en"]),
-        placeholder=t("personality_placeholder")
-    )
-    if not personality:
-        personality = preset_personalities[0]  # Default option
-else:
-    personality = selected_personality
-
-# Prison bars CSS overlay for rate limited state
-if is_rate_limited():
-    st.markdown("""
-    <style>
-    div[data-testid="stTextInput"]:first-of-type + div + div div[data-testid="stTextInput"] {
-        position: relative !important;
-    }
-    div[data-testid="stTextInput"]:first-of-type + div + div div[data-testid="stTextInput"]::before {
-        content: "";
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        z-index: 9999;
-        cursor: not-allowed;
-    }
-    div[data-testid="stTextInput"]:first-of-type + div + div div[data-testid="stTextInput"] > div:last-child::before {
-        content: "";
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background:
-            repeating-linear-gradient(
-                90deg,
-                transparent 0px,
-                transparent 14px,
-                #0a0a15 14px,
-                #1a1a30 15px,
-                #2a2a45 16px,
-                #1a1a30 17px,
-                #0a0a15 18px,
-                transparent 18px
-            );
-        pointer-events: none;
-        z-index: 999;
-        border-radius: 12px;
-    }
-    div[data-testid="stTextInput"]:first-of-type + div + div div[data-testid="stTextInput"] > div:last-child::after {
-        content: "";
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background:
-            repeating-linear-gradient(
-                90deg,
-                transparent 0px,
-                transparent 14px,
-                rgba(0, 255, 255, 0.3) 15px,
-                rgba(255, 0, 255, 0.2) 16px,
-                rgba(0, 255, 255, 0.1) 17px,
-                transparent 18px
-            );
-        pointer-events: none;
-        z-index: 1000;
-        border-radius: 12px;
-    }
-    div[data-testid="stTextInput"]:first-of-type + div + div div[data-testid="stTextInput"] input {
-        background: rgba(5, 5, 10, 0.9) !important;
-        cursor: not-allowed !important;
-        color: #1a1a30 !important;
-        border: 2px solid #1a0a2e !important;
-        box-shadow: inset 0 0 30px rgba(0,0,0,0.9) !important;
-    }
-    button[disabled] {
-        opacity: 0.2 !important;
-        pointer-events: none !important;
-        filter: grayscale(100%) !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+@st.fragment
+@timed("render.search")
+def search_panel():
+    """Personality, search box and the result or home page; searching reruns only this panel"""
+    lang = st.session_state.language
+    preset_personalities = PERSONALITIES.get(lang, PERSONALITIES["en"])
+    custom_option = preset_personalities[-1]  # Last item is always custom
 
-# Search input
-col_input, col_random = st.columns([4, 1])
-with col_input:
-    symbol = st.text_input(
-        t("search_label"),
-        placeholder=t("search_placeholder"),
-        disabled=is_rate_limited(),
-        key="search_input"
-    )
-with col_random:
-    st.write("")
-    st.write("")
-    if st.button(f"🎲 {t('random_btn')}", disabled=is_rate_limited()):
-        st.session_state.selected_coin = random.choice(TOP_50_COINS)
-        st.rerun()
+    selected_personality = st.selectbox(t("personality_label"), preset_personalities)
 
-# Rate limit warning
-if is_rate_limited():
-    st.markdown(f"""
-    <div style="
-        background: linear-gradient(135deg, #2d0a3d 0%, #1a0a2e 100%);
-        border: 1px solid #ff00ff;
-        border-radius: 12px;
-        padding: 16px 20px;
-        margin: 10px 0;
-        display: flex;
-        align-items: center;
-        gap: 12px;
-        box-shadow: 0 0 20px rgba(255, 0, 255, 0.2);
-    ">
-        <span style="font-size: 24px;">🔒</span>
-        <div>
-            <div style="color: #ff00ff; font-weight: 600; margin-bottom: 4px;">{t("search_limit")}</div>
-            <div style="color: #a0a0b0; font-size: 14px;">{t("search_limit_msg")}</div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-    time.sleep(3)
-    if check_api_available():
-        clear_rate_limit()
-        st.rerun()
+    if selected_personality == custom_option:
+        personality = st.text_input(
+            CUSTOM_INPUT_LABELS.get(lang, CUSTOM_INPUT_LABELS["en"]),
+            placeholder=t("personality_placeholder")
+        )
+        if not personality:
+            personality = preset_personalities[0]  # Default option
     else:
-        st.rerun()
-
-# Use random coin if selected
-if "selected_coin" in st.session_state and st.session_state.selected_coin:
-    symbol = st.session_state.selected_coin
-    del st.session_state.selected_coin
-
-# Search and display
-if symbol and not is_rate_limited():
-    search_data = search_coin(symbol.lower().strip())
-
-    if "error" in search_data:
-        if search_data['error'] == 429:
-            set_rate_limit()
-            st.rerun()
-        else:
-            st.error(f"Search error: {search_data.get('message', 'Unknown error')}")
-    elif search_data.get("coins"):
-        coin = search_data["coins"][0]
-        coin_id, coin_name, coin_symbol = coin["id"], coin["name"], coin["symbol"].upper()
-
-        price_data = get_price(coin_id)
-
-        if "error" in price_data:
-            if price_data['error'] == 429:
+        personality = selected_personality
+
+
+    # Search input; the container key switches on the prison bars overlay while rate limited
+    with st.container(key="search_locked" if is_rate_limited() else "search_box"):
+        col_input, col_random = st.columns([4, 1])
+        with col_input:
+            symbol = st.text_input(
+                t("search_label"),
+                placeholder=t("search_placeholder"),
+                disabled=is_rate_limited(),
+                key="search_input"
+            )
+        with col_random:
+            st.write("")
+            st.write("")
+            if st.button(f"🎲 {t('random_btn')}", disabled=is_rate_limited()):
+                st.session_state.selected_coin = random.choice(TOP_50_COINS)
+                rerun_fragment()
+
+    # Rate limit warning
+    if is_rate_limited():
+        st.markdown(f"""
+        <div class="rate-limit-notice">
+            <span class="icon">🔒</span>
+            <div>
+                <div class="title">{t("search_limit")}</div>
+                <div class="message">{t("search_limit_msg")}</div>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+        rate_limit_watcher()
+
+    # Use random coin if selected
+    if "selected_coin" in st.session_state and st.session_state.selected_coin:
+        symbol = st.session_state.selected_coin
+        del st.session_state.selected_coin
+
+    # Search and display
+    if symbol and not is_rate_limited():
+        query = symbol.lower().strip()
+        search_data = lookup_coin(query)
+
+        if "error" in search_data:
+            if search_data['error'] == 429:
+                search_coin.clear(query)
                 set_rate_limit()
                 st.rerun()
+            elif search_data['error'] == "busy":
+                search_coin.clear(query)
+                st.warning(t("busy_retry"))
             else:
-                st.error(f"Price error: {price_data.get('message', 'Unknown error')}")
-        elif coin_id in price_data:
-            data = price_data[coin_id]
-            price, change_24h = data["usd"], data["usd_24h_change"]
-
-            col_title, col_watch = st.columns([4, 1])
-            with col_title:
-                st.subheader(f"{coin_name} ({coin_symbol})")
-            with col_watch:
-                if coin_id not in st.session_state.watchlist:
-                    if st.button(f"➕ {t('watch_btn')}"):
-                        st.session_state.watchlist[coin_id] = {
-                            "name": coin_name, "symbol": coin_symbol, "threshold": 10
-                        }
-                        save_watchlist(st.session_state.watchlist)
-                        st.rerun()
-                else:
-                    st.success(f"✓ {t('watching')}")
+                st.error(f"Search error: {search_data.get('message', 'Unknown error')}")
+        elif search_data.get("coins"):
+            coin = search_data["coins"][0]
+            coin_id, coin_name, coin_symbol = coin["id"], coin["name"], coin["symbol"].upper()
 
-            col1, col2 = st.columns(2)
-            col1.metric(t("price_label"), f"${price:,.2f}")
-            col2.metric(t("change_label"), f"{change_24h:.2f}%", delta=f"{change_24h:.2f}%")
+            price_data = get_price(coin_id)
 
-            if api_key:
-                with st.spinner(t("getting_vibe")):
-                    result = get_vibe_check(coin_name, price, change_24h, personality, api_key, st.session_state.language)
+            if "error" in price_data:
+                if price_data['error'] == 429:
+                    get_price.clear(coin_id)
+                    set_rate_limit()
+                    st.rerun()
+                elif price_data['error'] == "busy":
+                    st.warning(t("busy_retry"))
+                else:
+                    st.error(f"Price error: {price_data.get('message', 'Unknown error')}")
+            elif coin_id in price_data:
+                data = price_data[coin_id]
+                price, change_24h = data["usd"], data["usd_24h_change"]
+
+                col_title, col_watch = st.columns([4, 1])
+                with col_title:
+                    st.subheader(f"{coin_name} ({coin_symbol})")
+                with col_watch:
+                    if coin_id not in st.session_state.watchlist:
+                        if st.button(f"➕ {t('watch_btn')}"):
+                            add_to_watchlist(coin_id, coin_name, coin_symbol)
+                            st.rerun()
+                    else:
+                        st.success(f"✓ {t('watching')}")
 
-                if result["success"]:
-                    st.markdown("<br>", unsafe_allow_html=True)
+                col1, col2 = st.columns(2)
+                col1.metric(t("price_label"), f"${price:,.2f}")
+                col2.metric(t("change_label"), f"{change_24h:.2f}%", delta=f"{change_24h:.2f}%")
+                stale_caption(get_price.staleness(coin_id))
 
-                    rating = result['rating']
-                    emoji = get_rating_emoji(rating)
-
-                    if rating <= 3:
-                        vibe_color = "#ff0066"
-                        vibe_glow = "rgba(255, 0, 102, 0.3)"
-                        vibe_bg = "linear-gradient(135deg, #2d0a1a 0%, #1a0a2e 100%)"
-                    elif rating <= 6:
-                        vibe_color = "#ffff00"
-                        vibe_glow = "rgba(255, 255, 0, 0.3)"
-                        vibe_bg = "linear-gradient(135deg, #2d2d0a 0%, #1a0a2e 100%)"
-                    else:
-                        vibe_color = "#00ff88"
-                        vibe_glow = "rgba(0, 255, 136, 0.3)"
-                        vibe_bg = "linear-gradient(135deg, #0a2d1a 0%, #1a0a2e 100%)"
-
-                    st.markdown(f"""
-                    <div style="
-                        background: {vibe_bg};
-                        border: 1px solid {vibe_color};
-                        border-radius: 16px;
-                        padding: 24px;
-                        margin: 10px 0;
-                        box-shadow: 0 0 30px {vibe_glow};
-                    ">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 16px;">
-                            <span style="color: #00ffff; font-size: 20px; font-weight: 600; text-shadow: 0 0 10px rgba(0, 255, 255, 0.5);">{t("the_vibe")}</span>
-                            <div style="
-                                background: rgba(10, 10, 20, 0.8);
-                                border: 1px solid {vibe_color};
-                                border-radius: 12px;
-                                padding: 8px 16px;
-                                display: flex;
-                                align-items: center;
-                                gap: 8px;
-                                box-shadow: 0 0 15px {vibe_glow};
-                            ">
-                                <span style="font-size: 28px;">{emoji}</span>
-                                <span style="color: {vibe_color}; font-size: 24px; font-weight: 700; text-shadow: 0 0 10px {vibe_glow};">{rating}/10</span>
-                            </div>
-                        </div>
-                        <p style="color: #e0e0e0; font-size: 16px; line-height: 1.6; margin: 0;">{result["message"]}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
+                if api_key:
+                    st.markdown("<br>", unsafe_allow_html=True)
+                    vibe_slot = st.empty()
+                    for result in vibe_results(coin_name, price, change_24h, personality, api_key, st.session_state.language):
+                        if result["success"]:
+                            vibe_slot.markdown(
+                                vibe_card_html(result['rating'], result["message"] or t("getting_vibe")),
+                                unsafe_allow_html=True
+                            )
+                        else:
+                            vibe_slot.error(f"Vibe error: {result['message']}")
                 else:
-                    st.error(f"Vibe error: {result['message']}")
+                    st.error("Add GROQ_API_KEY to .streamlit/secrets.toml")
             else:
-                st.error("Add GROQ_API_KEY to .streamlit/secrets.toml")
+                st.error(f"No price data for {coin_name}")
         else:
-            st.error(f"No price data for {coin_name}")
-    else:
-        st.warning(t("not_found").format(symbol=symbol))
-
-# Home page content when no search
-elif not is_rate_limited():
-    # Floating coins animation
-    st.markdown("""
-    <style>
-    @keyframes float {
-        0%, 100% { transform: translateY(0) rotate(0deg); opacity: 0.6; }
-        50% { transform: translateY(-20px) rotate(10deg); opacity: 1; }
-    }
-    @keyframes floatSlow {
-        0%, 100% { transform: translateY(0) rotate(0deg); opacity: 0.4; }
-        50% { transform: translateY(-30px) rotate(-10deg); opacity: 0.8; }
-    }
-    @keyframes floatFast {
-        0%, 100% { transform: translateY(0) rotate(5deg); opacity: 0.5; }
-        50% { transform: translateY(-15px) rotate(-5deg); opacity: 0.9; }
-    }
-    .floating-coins {
-        position: fixed;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        pointer-events: none;
-        z-index: 0;
-        overflow: hidden;
-    }
-    .coin {
-        position: absolute;
-        font-size: 24px;
-        opacity: 0.5;
-    }
-    .coin:nth-child(1) { top: 15%; left: 10%; animation: float 4s ease-in-out infinite; }
-    .coin:nth-child(2) { top: 25%; right: 15%; animation: floatSlow 5s ease-in-out infinite 0.5s; }
-    .coin:nth-child(3) { top: 45%; left: 5%; animation: floatFast 3s ease-in-out infinite 1s; }
-    .coin:nth-child(4) { top: 60%; right: 8%; animation: float 4.5s ease-in-out infinite 1.5s; }
-    .coin:nth-child(5) { top: 75%; left: 12%; animation: floatSlow 5.5s ease-in-out infinite 0.3s; }
-    .coin:nth-child(6) { top: 35%; right: 5%; animation: floatFast 3.5s ease-in-out infinite 0.8s; }
-    .coin:nth-child(7) { top: 85%; right: 20%; animation: float 4s ease-in-out infinite 1.2s; }
-    .coin:nth-child(8) { top: 10%; left: 25%; animation: floatSlow 6s ease-in-out infinite 0.7s; }
-    .coin:nth-child(9) { top: 55%; left: 20%; animation: floatFast 3.2s ease-in-out infinite 1.8s; }
-    .coin:nth-child(10) { top: 70%; right: 25%; animation: float 4.8s ease-in-out infinite 0.4s; }
-    </style>
-    <div class="floating-coins">
-        <span class="coin">🪙</span>
-        <span class="coin">💰</span>
-        <span class="coin">₿</span>
-        <span class="coin">🪙</span>
-        <span class="coin">💎</span>
-        <span class="coin">🚀</span>
-        <span class="coin">💰</span>
-        <span class="coin">₿</span>
-        <span class="coin">🪙</span>
-        <span class="coin">💎</span>
-    </div>
-    """, unsafe_allow_html=True)
-
-    # Trending row
-    st.markdown(f"#### 🔥 {t('trending')}")
-    trending = get_trending_coins()
-    if trending:
-        cols = st.columns(7)
-        for i, item in enumerate(trending[:7]):
-            coin = item.get("item", {})
-            with cols[i]:
-                if st.button(
-                    coin.get('symbol', '').upper(),
-                    key=f"trend_{coin.get('id')}",
-                    help=f"#{coin.get('market_cap_rank', '?')} {coin.get('name', '')}"
-                ):
-                    st.session_state.selected_coin = coin.get('id')
-                    st.rerun()
+            st.warning(t("not_found").format(symbol=symbol))
+
+    # Home page content when no search
+    elif not is_rate_limited():
+        # Floating coins animation
+        st.markdown("""
+        <div class="floating-coins">
+            <span class="coin">🪙</span>
+            <span class="coin">💰</span>
+            <span class="coin">₿</span>
+            <span class="coin">🪙</span>
+            <span class="coin">💎</span>
+            <span class="coin">🚀</span>
+            <span class="coin">💰</span>
+            <span class="coin">₿</span>
+            <span class="coin">🪙</span>
+            <span class="coin">💎</span>
+        </div>
+        """, unsafe_allow_html=True)
+
+        # Trending row
+        st.markdown(f"#### 🔥 {t('trending')}")
+        trending = get_trending_coins()
+        if trending:
+            cols = st.columns(7)
+            for i, item in enumerate(trending[:7]):
+                coin = item.get("item", {})
+                with cols[i]:
+                    if st.button(
+                        coin.get('symbol', '').upper(),
+                        key=f"trend_{coin.get('id')}",
+                        help=f"#{coin.get('market_cap_rank', '?')} {coin.get('name', '')}"
+                    ):
+                        st.session_state.selected_coin = coin.get('id')
+                        rerun_fragment()
+            stale_caption(get_trending_coins.staleness())
+
+search_panel()
 
 # Floating language selector in bottom left - using popover
-st.markdown("""
-<style>
-/* Style the floating language popover */
-div[data-testid="stPopover"] > div:first-child > button {
-    position: fixed !important;
-    bottom: 20px !important;
-    left: 20px !important;
-    z-index: 9999 !important;
-    background: linear-gradient(135deg, rgba(0, 255, 255, 0.2) 0%, rgba(255, 0, 255, 0.2) 100%) !important;
-    border: 1px solid rgba(0, 255, 255, 0.5) !important;
-    border-radius: 20px !important;
-    padding: 10px 18px !important;
-    color: #00ffff !important;
-    font-size: 14px !important;
-    font-weight: 600 !important;
-    backdrop-filter: blur(10px) !important;
-    box-shadow: 0 4px 15px rgba(0, 0, 0, 0.3) !important;
-    min-height: 44px !important;
-}
-div[data-testid="stPopover"] > div:first-child > button:hover {
-    border-color: #ff00ff !important;
-    box-shadow: 0 4px 20px rgba(255, 0, 255, 0.3) !important;
-}
-/* Popover content styling */
-div[data-testid="stPopoverBody"] {
-    background: linear-gradient(135deg, rgba(10, 10, 20, 0.98) 0%, rgba(26, 10, 46, 0.98) 100%) !important;
-    border: 1px solid rgba(0, 255, 255, 0.5) !important;
-    border-radius: 16px !important;
-    backdrop-filter: blur(10px) !important;
-}
-div[data-testid="stPopoverBody"] button {
-    background: rgba(20, 20, 40, 0.8) !important;
-    border: 1px solid rgba(0, 255, 255, 0.3) !important;
-    border-radius: 10px !important;
-    color: #e0e0e0 !important;
-    padding: 12px 20px !important;
-    margin: 4px 0 !important;
-    width: 100% !important;
-    min-height: 48px !important;
-    font-size: 16px !important;
-    transition: all 0.2s ease !important;
-}
-div[data-testid="stPopoverBody"] button:hover {
-    background: rgba(0, 255, 255, 0.2) !important;
-    border-color: #00ffff !important;
-    color: #00ffff !important;
-}
-@media screen and (max-width: 768px) {
-    div[data-testid="stPopover"] > div:first-child > button {
-        bottom: 70px !important;
-        left: 10px !important;
-        padding: 12px 20px !important;
-        font-size: 16px !important;
-        min-height: 50px !important;
-    }
-    div[data-testid="stPopoverBody"] button {
-        padding: 14px 20px !important;
-        min-height: 52px !important;
-        font-size: 18px !important;
-    }
-}
-</style>
-""", unsafe_allow_html=True)
 
 # Language popover with clickable options
 current_lang_name = LANGUAGE_OPTIONS.get(st.session_state.language, "English")
@@ -1609,6 +3912,12 @@ with st.popover(f"🌐 {current_lang_name}"):
         ):
             if lang_code != st.session_state.language:
                 st.session_state.language = lang_code
-                st.session_state.settings["language"] = lang_code
-                save_settings(st.session_state.settings)
+                save_setting("language", lang_code)
                 st.rerun()
+
+if config_value("METRICS_PANEL", False):
+    metrics_panel()
+
+get_metrics().observe("rerun", time.perf_counter() - IMPORT_STARTED)
+finish_profile()
+finish_startup_report("main")
@@ -0,0 +1,414 @@
+"""Load test: N concurrent browser sessions against one `streamlit run app.py` server.
+
+Each level starts a fresh server, stub and data directory, then opens N
+websocket clients that speak Streamlit's own protocol, so every session gets
+the real per-session script thread and shares the server's caches and alert
+worker exactly as browser tabs would. Each session is a different user with
+its own watchlist: it picks a language, searches, watches the result and
+edits that coin's threshold, with some think time between actions. Like a
+real user it dismisses alert popups as they cover the page, and like the
+frontend it honours run_every fragment reruns.
+
+Per level the report gives rerun p50/p99 (pooled, and the worst session's
+p99), the server's peak RSS, thread count and CPU, and the upstream request
+rate. Write the curve with --json and compare a later run against it with
+--baseline.
+
+    python -m benchmarks.load                           # 1, 2, 4, 8, 16 sessions
+    python -m benchmarks.load --sessions 1 8 32 --steps 40
+    python -m benchmarks.load --json before.json
+    python -m benchmarks.load --baseline before.json
+
+RSS, threads and CPU are read from /proc, so they are only reported on Linux.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+
+from benchmarks.run import APP_FILE, REPO_DIR, SEARCH_TERMS, free_port, percentile
+from benchmarks.stub_server import StubConfig, StubServer
+
+SERVER_START_TIMEOUT = 60
+RUN_TIMEOUT = 60
+SAMPLE_INTERVAL = 0.25
+LOG_TAIL_BYTES = 4000
+ACTIONS = ["search", "watch", "edit", "threshold", "save"]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class AppServer:
+    """A `streamlit run app.py` process pointed at its own stub and data directory"""
+
+    def __init__(self, args):
+        self.stub = StubServer(StubConfig(args.latency_ms, args.llm_latency_ms, args.rate_limit)).start()
+        self.data_dir = tempfile.mkdtemp(prefix="vibe-load-")
+        secrets = os.path.join(self.data_dir, "secrets.toml")
+        with open(secrets, "w") as f:
+            f.write('GROQ_API_KEY = "bench"\n')
+        self.port = free_port()
+        # A file, not a pipe: nobody drains the server's stderr while it runs
+        self.log_path = os.path.join(self.data_dir, "streamlit.log")
+        self.log = open(self.log_path, "w")
+        env = dict(os.environ, **self.stub.env(), VIBE_CHECK_DATA_DIR=self.data_dir,
+                   COINGECKO_CALLS_PER_MINUTE=str(args.calls_per_minute), COINGECKO_BURST=str(args.burst))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", APP_FILE, "--server.headless", "true",
+             "--server.port", str(self.port), "--browser.gatherUsageStats", "false",
+             "--secrets.files", secrets],
+            cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=self.log
+        )
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def wait_ready(self):
+        deadline = time.time() + SERVER_START_TIMEOUT
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"streamlit exited with status {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("streamlit did not start in time")
+
+    def log_tail(self):
+        """The end of the server's stderr log"""
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(max(0, os.path.getsize(self.log_path) - LOG_TAIL_BYTES))
+                return f.read().decode(errors="replace")
+        except OSError:
+            return ""
+
+    def sample(self):
+        """RSS in MB, OS thread count and CPU seconds of the server, or None off Linux"""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                status = dict(line.split(":", 1) for line in f)
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, ValueError):
+            return None
+        return {
+            "rss_mb": int(status["VmRSS"].split()[0]) / 1024,
+            "threads": int(status["Threads"]),
+            "cpu_s": (int(fields[11]) + int(fields[12])) / self.clock_ticks,
+        }
+
+    def upstream(self):
+        return self.stub.state.stats()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.stub.stop()
+        self.log.close()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+class BrowserSession:
+    """One browser tab: sends rerun requests and times them until the script finishes"""
+
+    def __init__(self, url, user):
+        self.url = url
+        self.query = f"u={user}"
+        self.ws = None
+        self.widgets = {}     # widget id -> (element type, label, fragment id)
+        self.values = {}      # widget id -> WidgetState we have set
+        self.auto_reruns = {} # fragment id -> [interval, next due]
+        self.timings = []
+        self.exceptions = []
+
+    async def open(self):
+        from websockets.asyncio.client import connect
+
+        self.ws = await connect(self.url, subprotocols=["streamlit"], max_size=None)
+        await self.rerun("open")
+
+    async def close(self):
+        if self.ws:
+            await self.ws.close()
+
+    def find(self, key=None, label=None):
+        """Widget id by its key, or by label prefix for widgets without one"""
+        for widget_id, (_, widget_label, _) in self.widgets.items():
+            if (key and widget_id.endswith(f"-{key}")) or (label and widget_label.startswith(label)):
+                return widget_id
+        return None
+
+    async def rerun(self, action, widget_id=None, state=None, fragment_id=None, auto=False):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        if widget_id:
+            fragment_id = self.widgets[widget_id][2]
+            if state is not None:
+                self.values[widget_id] = state
+        back = BackMsg()
+        client = back.rerun_script
+        client.query_string = self.query
+        client.is_auto_rerun = auto
+        if fragment_id:
+            client.fragment_id = fragment_id
+        client.widget_states.widgets.extend(self.values.values())
+        if widget_id and state is None:
+            client.widget_states.widgets.append(WidgetState(id=widget_id, trigger_value=True))
+
+        started = time.perf_counter()
+        await self.ws.send(back.SerializeToString())
+        await asyncio.wait_for(self.read_run(fragment_id), RUN_TIMEOUT)
+        self.timings.append((action, (time.perf_counter() - started) * 1000))
+
+    async def read_run(self, fragment_id):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        if fragment_id:
+            self.widgets = {k: v for k, v in self.widgets.items() if v[2] != fragment_id}
+        else:
+            self.widgets = {}
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await self.ws.recv())
+            kind = msg.WhichOneof("type")
+            if kind == "new_session" and not msg.new_session.fragment_ids_this_run:
+                # An st.rerun() inside the run restarts the whole script
+                self.widgets = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                proto = getattr(element, element_type)
+                if element_type == "exception":
+                    self.exceptions.append(f"{proto.type}: {proto.message}")
+                elif getattr(proto, "id", ""):
+                    self.widgets[proto.id] = (element_type, getattr(proto, "label", ""), msg.delta.fragment_id)
+            elif kind == "auto_rerun":
+                interval = msg.auto_rerun.interval
+                self.auto_reruns[msg.auto_rerun.fragment_id] = [interval, time.time() + interval]
+            elif kind == "stop_auto_rerun":
+                self.auto_reruns.clear()
+            elif kind == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    async def due_auto_reruns(self):
+        now = time.time()
+        for fragment_id, schedule in list(self.auto_reruns.items()):
+            if now >= schedule[1]:
+                schedule[1] = now + schedule[0]
+                await self.rerun("auto", fragment_id=fragment_id, auto=True)
+
+    async def step(self, action, term, rng):
+        """One user action; returns False when the page doesn't offer it right now"""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        coin = self.watching
+        if action == "search":
+            widget = self.find(key="search_input")
+            if not widget:
+                return False
+            await self.rerun(action, widget, WidgetState(id=widget, string_value=term))
+        elif action == "watch":
+            widget = self.find(label="➕")
+            if not widget:
+                return False
+            await self.rerun(action, widget)
+        elif action == "edit":
+            widget = self.find(key=f"edit_{coin}") if coin else None
+            if not widget:
+                return False
+            await self.rerun(action, widget)
+        elif action == "threshold":
+            widget = self.find(key=f"thresh_{coin}") if coin else None
+            if not widget:
+                return False
+            value = WidgetState(id=widget)
+            value.double_array_value.data.append(rng.randint(1, 20))
+            await self.rerun(action, widget, value)
+        elif action == "save":
+            widget = self.find(key=f"save_{coin}") if coin else None
+            if not widget:
+                return False
+            await self.rerun(action, widget)
+        return True
+
+    @property
+    def watching(self):
+        """The most recently listed coin with a sidebar edit button"""
+        coins = [wid.rsplit("-edit_", 1)[1] for wid in self.widgets if "-edit_" in wid]
+        coins += [wid.rsplit("-save_", 1)[1] for wid in self.widgets if "-save_" in wid]
+        return coins[-1] if coins else None
+
+
+async def simulate(session, index, args):
+    rng = random.Random(index)
+    await session.open()
+    continue_button = session.find(label="Continue")
+    if continue_button:
+        await session.rerun("language", continue_button)
+    for step in range(args.steps):
+        await session.due_auto_reruns()
+        dismiss = session.find(label="✕")
+        if dismiss:
+            # An alert popup replaces the page until it's dismissed
+            await session.rerun("dismiss", dismiss)
+        else:
+            term = SEARCH_TERMS[(index + step // len(ACTIONS)) % len(SEARCH_TERMS)]
+            await session.step(ACTIONS[step % len(ACTIONS)], term, rng)
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+
+async def run_level(server, sessions, args):
+    samples = []
+
+    async def sampler():
+        while True:
+            sample = server.sample()
+            if sample:
+                samples.append(sample)
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    clients = [BrowserSession(server.url, f"load-{i:03d}") for i in range(sessions)]
+    sampling = asyncio.create_task(sampler())
+    before = server.sample()
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(simulate(c, i, args) for i, c in enumerate(clients)), return_exceptions=True)
+    wall = time.perf_counter() - started
+    after = server.sample()
+    sampling.cancel()
+    await asyncio.gather(*(c.close() for c in clients), return_exceptions=True)
+    return clients, outcomes, samples, before, after, wall
+
+
+def summarize(sessions, clients, outcomes, samples, before, after, wall, upstream):
+    opens = [ms for c in clients for action, ms in c.timings if action == "open"]
+    reruns = [[ms for action, ms in c.timings if action != "open"] for c in clients]
+    pooled = [ms for timings in reruns for ms in timings]
+    requests = upstream["requests"]
+    limited = sum(n for key, n in upstream["statuses"].items() if key.endswith(" 429"))
+    failures = [f"{type(o).__name__}: {o}" for o in outcomes if isinstance(o, BaseException)]
+    return {
+        "sessions": sessions,
+        "reruns": len(pooled),
+        "actions": dict(Counter(action for c in clients for action, _ in c.timings)),
+        "open_p50_ms": percentile(opens, 50),
+        "p50_ms": percentile(pooled, 50),
+        "p99_ms": percentile(pooled, 99),
+        "worst_session_p99_ms": max((percentile(t, 99) for t in reruns if t), default=None),
+        "peak_rss_mb": max((s["rss_mb"] for s in samples), default=None),
+        "peak_threads": max((s["threads"] for s in samples), default=None),
+        "cpu_pct": 100 * (after["cpu_s"] - before["cpu_s"]) / wall if before and after else None,
+        "upstream_per_s": sum(requests.values()) / wall,
+        "upstream_429": limited,
+        "upstream_requests": requests,
+        "wall_s": wall,
+        "failed_sessions": failures[:5],
+        "exceptions": sorted({e for c in clients for e in c.exceptions})[:5],
+    }
+
+
+def measure(sessions, args):
+    server = AppServer(args)
+    try:
+        server.wait_ready()
+        clients, outcomes, samples, before, after, wall = asyncio.run(run_level(server, sessions, args))
+        return summarize(sessions, clients, outcomes, samples, before, after, wall, server.upstream())
+    except Exception:
+        print(f"streamlit stderr, last lines:\n{server.log_tail()}", file=sys.stderr)
+        raise
+    finally:
+        server.stop()
+
+
+def fmt(value, spec=".0f"):
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(levels, baseline=None):
+    previous = {level["sessions"]: level for level in (baseline or {}).get("levels", [])}
+    header = (f"{'sessions':>8}{'reruns':>8}{'open':>8}{'p50':>8}{'p99':>8}{'worst':>8}"
+              f"{'RSS MB':>8}{'threads':>8}{'CPU %':>7}{'up/s':>7}{'429s':>6}")
+    if previous:
+        header += f"{'Δp50':>8}{'Δp99':>8}{'ΔRSS':>7}"
+    print(header)
+    print("-" * len(header))
+    for level in levels:
+        line = (f"{level['sessions']:>8}{level['reruns']:>8}{fmt(level['open_p50_ms']):>8}"
+                f"{fmt(level['p50_ms']):>8}{fmt(level['p99_ms']):>8}{fmt(level['worst_session_p99_ms']):>8}"
+                f"{fmt(level['peak_rss_mb']):>8}{fmt(level['peak_threads'], 'd'):>8}"
+                f"{fmt(level['cpu_pct']):>7}{fmt(level['upstream_per_s'], '.1f'):>7}{level['upstream_429']:>6}")
+        old = previous.get(level["sessions"])
+        if old:
+            deltas = [
+                (level[key] - old[key]) / old[key] if level[key] is not None and old.get(key) else None
+                for key in ("p50_ms", "p99_ms", "peak_rss_mb")
+            ]
+            line += "".join(f"{fmt(d, '+.0%'):>{w}}" for d, w in zip(deltas, (8, 8, 7)))
+        print(line)
+    print("\nLatencies in ms. 'open' is a session's first page load; p50/p99 pool every later rerun,"
+          "\n'worst' is the highest single-session p99. RSS, threads and CPU are the server process's.")
+    for level in levels:
+        for problem in level["failed_sessions"] + level["exceptions"]:
+            print(f"  {level['sessions']} sessions: {problem}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="concurrent session counts, one level each")
+    parser.add_argument("--steps", type=int, default=25, help="user actions per session")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="mean pause between a session's actions")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="added to every CoinGecko response")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="for a whole Groq completion")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of CoinGecko calls answered 429")
+    parser.add_argument("--calls-per-minute", type=int, default=500, help="CoinGecko budget given to the app")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--json", help="write the scaling curve to this file")
+    parser.add_argument("--baseline", help="a previous --json file to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    levels = []
+    for sessions in args.sessions:
+        print(f"Running {sessions} concurrent session(s)...", file=sys.stderr)
+        levels.append(measure(sessions, args))
+
+    if baseline:
+        print(f"Baseline: {args.baseline} (revision {baseline['meta'].get('revision')})")
+    print(f"CoinGecko budget: {args.calls_per_minute}/min, burst {args.burst}; "
+          f"{args.steps} actions per session, {args.think_ms:.0f} ms think time\n")
+    print_report(levels, baseline)
+    if args.json:
+        meta = {key: value for key, value in vars(args).items() if key not in ("json", "baseline")}
+        meta["revision"] = git_revision()
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "levels": levels}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Offline benchmarks: drive app.py headlessly with AppTest against the local stub.
+
+Each scenario runs in its own Python process, with a fresh stub server and
+a temporary data directory, so every scenario starts cold. The report
+gives rerun latency percentiles, upstream calls by endpoint (and how many
+were answered with 429), and cache hit rates.
+
+    python -m benchmarks.run                          # every scenario
+    python -m benchmarks.run search alert_popup -n 50
+    python -m benchmarks.run --latency-ms 120 --llm-latency-ms 800 --rate-limit 0.05
+    python -m benchmarks.run --json results.json
+    python -m benchmarks.run --calls-per-minute 30 --burst 5   # the app's free-tier budget
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(REPO_DIR, "app.py")
+RUN_TIMEOUT = 60
+LOCKED_POLL_INTERVAL = 0.5
+SEARCH_TERMS = ["btc", "eth", "sol", "doge", "pepe", "ada", "link", "bonk", "xrp", "avax"]
+SCENARIOS = {}
+
+
+def scenario(fn):
+    SCENARIOS[fn.__name__] = fn
+    return fn
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Session:
+    """One browser tab: an AppTest that times every run"""
+
+    def __init__(self, user=None):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_FILE, default_timeout=RUN_TIMEOUT)
+        self.at.secrets["GROQ_API_KEY"] = "bench"
+        if user:
+            self.at.query_params["u"] = user
+        else:
+            self.at.session_state["language"] = "en"
+        self.timings = []
+        self.errors = []
+
+    def run(self, action=None):
+        started = time.perf_counter()
+        (action or self.at).run()
+        self.timings.append((time.perf_counter() - started) * 1000)
+        self.errors.extend(e.value for e in self.at.exception)
+        return self.at
+
+    def button(self, prefix):
+        return next((b for b in self.at.button if b.label.startswith(prefix)), None)
+
+
+def write_legacy_watchlist(data_dir, coins, threshold):
+    """Seed the pre-database files; the app imports them for the shared user on first start"""
+    with open(os.path.join(data_dir, "watchlist.json"), "w") as f:
+        json.dump({c["id"]: {"name": c["name"], "symbol": c["symbol"].upper(), "threshold": threshold}
+                   for c in coins}, f)
+    with open(os.path.join(data_dir, "settings.json"), "w") as f:
+        json.dump({"language": "en"}, f)
+
+
+@scenario
+def cold_home(stub, data_dir, iterations):
+    """A new visitor lands on the home page, then reruns it"""
+    session = Session()
+    for _ in range(iterations):
+        session.run()
+    return session, {}
+
+
+@scenario
+def search(stub, data_dir, iterations):
+    """Searches cycling through popular symbols, so later rounds repeat earlier ones.
+
+    While a 429 holds the shared backoff the app disables the search box; the
+    scenario then reruns like a waiting user until it unlocks, counting those
+    reruns apart from the timed ones.
+    """
+    session = Session()
+    session.run()
+    searches = locked = 0
+    for i in range(iterations):
+        deadline = time.time() + RUN_TIMEOUT
+        while session.at.text_input(key="search_input").disabled and time.time() < deadline:
+            time.sleep(LOCKED_POLL_INTERVAL)
+            session.at.run()
+            locked += 1
+        search_input = session.at.text_input(key="search_input")
+        if search_input.disabled:
+            break
+        session.run(search_input.set_value(SEARCH_TERMS[i % len(SEARCH_TERMS)]))
+        searches += 1
+    return session, {"searches": searches, "locked_reruns": locked}
+
+
+@scenario
+def alert_popup(stub, data_dir, iterations):
+    """A watchlist where every coin has breached its threshold; each step dismisses one popup"""
+    universe = stub.state.universe
+    breached = [c for c in universe if abs(stub_quote(c["id"])["usd_24h_change"]) >= 2][:iterations + 1]
+    write_legacy_watchlist(data_dir, breached, 1)
+    session = Session(user="shared")
+    deadline = time.time() + RUN_TIMEOUT
+    # The background worker evaluates on its own thread; wait for the first popup
+    while session.button("✕") is None and time.time() < deadline:
+        session.run()
+        time.sleep(0.2)
+    for _ in range(iterations):
+        dismiss = session.button("✕")
+        if dismiss is None:
+            break
+        session.run(dismiss.click())
+    return session, {"popups": len(breached)}
+
+
+@scenario
+def watchlist_200(stub, data_dir, iterations):
+    """A 200-coin watchlist in the sidebar, none alerting, rerun repeatedly"""
+    write_legacy_watchlist(data_dir, stub.state.universe[:200], 50)
+    session = Session(user="shared")
+    for _ in range(iterations):
+        session.run()
+    return session, {"watched": 200}
+
+
+def stub_quote(coin_id):
+    from benchmarks.stub_server import quote
+    return quote(coin_id)
+
+
+def vibe_cache_stats(metrics_port):
+    """The app's vibe_cache_* gauges (VibeCache.stats) from its Prometheus exporter"""
+    prefix = "vibe_check_vibe_cache_"
+    with urllib.request.urlopen(f"http://127.0.0.1:{metrics_port}/metrics") as response:
+        lines = response.read().decode().splitlines()
+    stats = {"hits": 0, "misses": 0}
+    for line in lines:
+        if line.startswith(prefix):
+            name, value = line[len(prefix):].split()
+            stats[name] = float(value)
+    return stats
+
+
+def run_child(args):
+    """Run one scenario in this process and print its raw results as JSON"""
+    from benchmarks.stub_server import StubConfig, StubServer
+
+    config = StubConfig(args.latency_ms, args.llm_latency_ms, args.rate_limit, args.retry_after)
+    stub = StubServer(config).start()
+    data_dir = tempfile.mkdtemp(prefix="vibe-bench-")
+    os.environ.update(stub.env())
+    os.environ["VIBE_CHECK_DATA_DIR"] = data_dir
+    os.environ["COINGECKO_CALLS_PER_MINUTE"] = str(args.calls_per_minute)
+    os.environ["COINGECKO_BURST"] = str(args.burst)
+    metrics_port = free_port()
+    os.environ["METRICS_PORT"] = str(metrics_port)
+
+    started = time.perf_counter()
+    session, extra = SCENARIOS[args.child](stub, data_dir, args.iterations)
+    wall = time.perf_counter() - started
+    with urllib.request.urlopen(stub.base_url + "/_stats") as response:
+        upstream = json.load(response)
+    stub.stop()
+    print(json.dumps({
+        "scenario": args.child,
+        "timings_ms": session.timings,
+        "errors": session.errors[:5],
+        "wall_s": wall,
+        "upstream": upstream,
+        "vibe_cache": vibe_cache_stats(metrics_port),
+        **extra,
+    }))
+
+
+def summarize(raw):
+    timings = raw["timings_ms"]
+    requests = raw["upstream"]["requests"]
+    limited = sum(n for key, n in raw["upstream"]["statuses"].items() if key.endswith(" 429"))
+    vibes = raw["vibe_cache"]
+    lookups = vibes.get("hits", 0) + vibes.get("misses", 0)
+    summary = {
+        "runs": len(timings),
+        "first_ms": timings[0] if timings else None,
+        "p50_ms": percentile(timings, 50),
+        "p90_ms": percentile(timings, 90),
+        "p99_ms": percentile(timings, 99),
+        "max_ms": max(timings) if timings else None,
+        "upstream_calls": sum(requests.values()),
+        "upstream_429": limited,
+        "calls_per_run": sum(requests.values()) / len(timings) if timings else None,
+        "vibe_cache_hit_rate": vibes.get("hits", 0) / lookups if lookups else None,
+        "errors": raw["errors"],
+    }
+    if raw.get("searches"):
+        summary["search_local_hit_rate"] = 1 - requests.get("/search", 0) / raw["searches"]
+    if "locked_reruns" in raw:
+        summary["locked_reruns"] = raw["locked_reruns"]
+    return summary
+
+
+def print_report(results):
+    header = f"{'scenario':<15}{'runs':>5}{'first':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'calls':>7}{'429s':>6}{'vibe hit':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        s = result["summary"]
+        hit = f"{s['vibe_cache_hit_rate']:.0%}" if s["vibe_cache_hit_rate"] is not None else "-"
+        print(f"{name:<15}{s['runs']:>5}{s['first_ms']:>9.0f}{s['p50_ms']:>9.0f}{s['p90_ms']:>9.0f}"
+              f"{s['p99_ms']:>9.0f}{s['upstream_calls']:>7}{s['upstream_429']:>6}{hit:>10}")
+    print("\nLatencies in ms; 'first' is the cold first run of the scenario.")
+    for name, result in results.items():
+        s = result["summary"]
+        routes = ", ".join(f"{route} {n}" for route, n in sorted(result["raw"]["upstream"]["requests"].items()))
+        print(f"\n{name}: {routes or 'no upstream calls'}")
+        if "search_local_hit_rate" in s:
+            print(f"  searches answered without /search: {s['search_local_hit_rate']:.0%}")
+        if s.get("locked_reruns"):
+            print(f"  untimed reruns waiting out the 429 backoff: {s['locked_reruns']}")
+        if s["errors"]:
+            print(f"  app exceptions: {s['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="added to every CoinGecko response")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="for a whole Groq completion")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of CoinGecko calls answered 429")
+    parser.add_argument("--retry-after", type=int, default=2)
+    # The app's own default is CoinGecko's free tier (30/min, burst 5), which throttles
+    # scripted reruns to a few a minute; a paid-tier budget measures the app instead
+    parser.add_argument("--calls-per-minute", type=int, default=500, help="CoinGecko budget given to the app")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--json", help="also write the full results to this file")
+    parser.add_argument("--child", choices=list(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in args.scenarios or list(SCENARIOS):
+        command = [
+            sys.executable, "-m", "benchmarks.run", "--child", name,
+            "-n", str(args.iterations), "--latency-ms", str(args.latency_ms),
+            "--llm-latency-ms", str(args.llm_latency_ms), "--rate-limit", str(args.rate_limit),
+            "--retry-after", str(args.retry_after),
+            "--calls-per-minute", str(args.calls_per_minute), "--burst", str(args.burst),
+        ]
+        print(f"Running {name}...", file=sys.stderr)
+        child = subprocess.run(command, cwd=REPO_DIR, capture_output=True, text=True)
+        if child.returncode != 0:
+            print(child.stderr[-2000:], file=sys.stderr)
+            sys.exit(f"Scenario {name} failed")
+        raw = json.loads(child.stdout.strip().splitlines()[-1])
+        results[name] = {"summary": summarize(raw), "raw": raw}
+
+    print(f"CoinGecko budget: {args.calls_per_minute}/min, burst {args.burst}\n")
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Local stand-in for the CoinGecko and Groq endpoints the app calls.
+
+Responses are built from the fixtures in fixtures/, hand-written in the
+shapes CoinGecko returns rather than recorded from live traffic, plus a
+deterministic synthetic coin universe, so runs are repeatable offline.
+Latency and 429 injection are configurable, and every request is counted
+by route and status for the benchmark report.
+
+Run it on its own to point a real `streamlit run app.py` at it:
+
+    python -m benchmarks.stub_server --port 8765 --latency-ms 80
+    COINGECKO_API=http://127.0.0.1:8765/api/v3 GROQ_API=http://127.0.0.1:8765/openai/v1 streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+COINGECKO_PREFIX = "/api/v3"
+GROQ_PREFIX = "/openai/v1"
+UNIVERSE_SIZE = 1000
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 0.0
+    llm_latency_ms: float = 0.0
+    rate_limit: float = 0.0
+    retry_after: int = 2
+    seed: int = 0
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+
+def coin_hash(coin_id):
+    return int(hashlib.md5(coin_id.encode()).hexdigest()[:8], 16)
+
+
+def quote(coin_id):
+    """Stable price and 24h change per coin, spread over about ±20%"""
+    h = coin_hash(coin_id)
+    return {
+        "usd": round(0.01 + (h % 100000) / 10.0, 4),
+        "usd_24h_change": ((h >> 17) % 400 - 200) / 10.0,
+        "last_updated_at": int(time.time()) // 60 * 60,
+    }
+
+
+def build_universe():
+    """The fixture top coins followed by synthetic ones, in market-cap order"""
+    coins = load_fixture("coins_list.json")
+    for i in range(len(coins), UNIVERSE_SIZE):
+        coins.append({"id": f"benchcoin-{i:04d}", "symbol": f"bc{i:04d}", "name": f"Benchcoin {i:04d}"})
+    return coins
+
+
+def route_name(path):
+    """Collapse per-coin paths so counts group by endpoint"""
+    return re.sub(r"/coins/(?!list|markets)[^/]+/", "/coins/:id/", path)
+
+
+class StubState:
+    def __init__(self, config):
+        self.config = config
+        self.universe = build_universe()
+        self.by_id = {c["id"]: c for c in self.universe}
+        self.trending = load_fixture("trending.json")
+        self.global_data = load_fixture("global.json")
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.statuses = Counter()
+
+    def count(self, route, status):
+        with self.lock:
+            self.requests[route] += 1
+            self.statuses[f"{route} {status}"] += 1
+
+    def should_limit(self):
+        with self.lock:
+            return self.config.rate_limit > 0 and self.random.random() < self.config.rate_limit
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "statuses": dict(self.statuses)}
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.statuses.clear()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, route, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if route:
+            self.state.count(route, status)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/_stats":
+            return self.send_json(None, 200, self.state.stats())
+        if url.path == "/_reset":
+            self.state.reset()
+            return self.send_json(None, 200, {})
+        if not url.path.startswith(COINGECKO_PREFIX):
+            return self.send_json(url.path, 404, {"error": "not found"})
+
+        path = url.path[len(COINGECKO_PREFIX):]
+        route = route_name(path)
+        time.sleep(self.state.config.latency_ms / 1000)
+        if path != "/ping" and self.state.should_limit():
+            return self.send_json(
+                route, 429, {"status": {"error_code": 429, "error_message": "You've exceeded the Rate Limit."}},
+                {"Retry-After": str(self.state.config.retry_after)}
+            )
+        body = self.coingecko(path, query)
+        if body is None:
+            return self.send_json(route, 404, {"error": "coin not found"})
+        self.send_json(route, 200, body)
+
+    def coingecko(self, path, query):
+        state = self.state
+        if path == "/ping":
+            return {"gecko_says": "(V3) To the Moon!"}
+        if path == "/search":
+            q = query.get("query", "").lower()
+            matches = [c for c in state.universe if q and (c["symbol"] == q or q in c["name"].lower() or q in c["id"])]
+            return {"coins": [
+                {"id": c["id"], "name": c["name"], "api_symbol": c["id"], "symbol": c["symbol"].upper(),
+                 "market_cap_rank": state.universe.index(c) + 1}
+                for c in matches[:25]
+            ], "exchanges": [], "icos": [], "categories": [], "nfts": []}
+        if path == "/simple/price":
+            ids = [i for i in query.get("ids", "").split(",") if i in state.by_id]
+            return {i: quote(i) for i in ids}
+        if path == "/search/trending":
+            return state.trending
+        if path == "/global":
+            return state.global_data
+        if path == "/coins/list":
+            return state.universe
+        if path == "/coins/markets":
+            per_page = int(query.get("per_page", 100))
+            page = int(query.get("page", 1))
+            rows = state.universe[(page - 1) * per_page:page * per_page]
+            start = (page - 1) * per_page
+            return [
+                {"id": c["id"], "symbol": c["symbol"], "name": c["name"], "market_cap_rank": start + i + 1,
+                 "current_price": quote(c["id"])["usd"],
+                 "price_change_percentage_24h": quote(c["id"])["usd_24h_change"]}
+                for i, c in enumerate(rows)
+            ]
+        match = re.fullmatch(r"/coins/([^/]+)/market_chart(/range)?", path)
+        if match:
+            coin_id = match.group(1)
+            if coin_id not in state.by_id:
+                return None
+            now = time.time()
+            if match.group(2):
+                start, end = float(query["from"]), float(query["to"])
+            else:
+                days = float(query.get("days", 7))
+                start, end = now - days * 86400, now
+            # CoinGecko's granularity: 5-minutely within a day, hourly to 90 days, daily beyond
+            span = end - start
+            step = 300 if span <= 86400 else 3600 if span <= 90 * 86400 else 86400
+            base = quote(coin_id)["usd"]
+            seed = coin_hash(coin_id)
+            prices = [
+                [int(t * 1000), round(base * (1 + 0.1 * ((int(t // step) * 2654435761 + seed) % 1000 - 500) / 5000), 6)]
+                for t in range(int(start) - int(start) % step + step, int(end), step)
+            ]
+            return {"prices": prices, "market_caps": [], "total_volumes": []}
+        return None
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        route = url.path[len(GROQ_PREFIX):] if url.path.startswith(GROQ_PREFIX) else url.path
+        if route != "/chat/completions":
+            return self.send_json(route, 404, {"error": "not found"})
+        delay = self.state.config.llm_latency_ms / 1000
+        prompt = body["messages"][-1]["content"]
+
+        if body.get("response_format", {}).get("type") == "json_object":
+            time.sleep(delay)
+            market = json.loads(re.search(r"^\[.*\]$", prompt, re.M).group(0))
+            vibes = [{"id": c["id"], "rating": 1 + coin_hash(c["id"]) % 10,
+                      "vibe": f"{c['name']} is moving. Traders are watching closely."} for c in market]
+            return self.send_json(route, 200, completion(json.dumps({"coins": vibes})))
+
+        text = "RATING: 7\nVIBE: Solid momentum with a side of caution. The charts look steady for now."
+        if not body.get("stream"):
+            time.sleep(delay)
+            return self.send_json(route, 200, completion(text))
+
+        # Server-sent events, with the latency spread across the chunks
+        chunks = re.findall(r"\S+\s*", text)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            event = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+            self.wfile.write(b"data: " + json.dumps(event).encode() + b"\n\n")
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+        self.state.count(route, 200)
+
+
+def completion(content):
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "model": "llama-3.3-70b-versatile",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+class StubServer:
+    """The stub on a background thread; port 0 picks a free port"""
+
+    def __init__(self, config=None, port=0):
+        self.state = StubState(config or StubConfig())
+        handler = type("BoundStubHandler", (StubHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def env(self):
+        """Environment that points app.py at this stub"""
+        return {"COINGECKO_API": self.base_url + COINGECKO_PREFIX, "GROQ_API": self.base_url + GROQ_PREFIX}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every CoinGecko response")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="delay for a whole Groq completion")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of CoinGecko calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=2)
+    args = parser.parse_args()
+    config = StubConfig(args.latency_ms, args.llm_latency_ms, args.rate_limit, args.retry_after)
+    server = StubServer(config, args.port)
+    print(f"Stub listening on {server.base_url}")
+    for key, value in server.env().items():
+        print(f"  {key}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()